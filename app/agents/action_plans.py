@@ -0,0 +1,94 @@
+import os
+import json
+from .rules import rule_plan
+
+PLANS_PATH = os.getenv("ACTION_PLANS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "action_plans.json"))
+
+
+class ActionPlanTemplates:
+    """
+    Plan de acción del IncidentResponder a partir de plantillas (action_plans.json):
+    asunto, introducción y pasos según el nivel de riesgo, más un paso por cada flag detectado.
+    Instantáneo y determinista; no necesita el LLM.
+    """
+
+    def __init__(self, config: dict):
+        self.levels = config["levels"]
+        self.digest = config["digest"]
+        self.flag_steps = config.get("flag_steps", {})
+        self.closing = config.get("closing", "")
+        self.enrichment_heading = config.get("enrichment_heading", "")
+
+    @classmethod
+    def load(cls, path: str = PLANS_PATH):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def _steps(self, base_steps: list, flags: list) -> tuple:
+        """Pasos del nivel + uno por flag con plantilla. Returns (pasos, flags sin paso propio)."""
+        keys, unknown = rule_plan.flag_keys(flags)
+        uncovered = [key for key in keys if key not in self.flag_steps] + unknown
+        return base_steps + [self.flag_steps[key] for key in keys if key in self.flag_steps], uncovered
+
+    def _compose(self, subject: str, intro: str, sections: list, steps: list) -> str:
+        lines = ["Asunto: " + subject, "", "Estimado/a Profesor/a Tutor/a:", "", intro, ""]
+        for heading, body in sections:
+            lines += [heading, body, ""]
+        lines += ["Pasos a seguir:", *[f"{i}. {step}" for i, step in enumerate(steps, 1)], "", self.closing]
+        return "\n".join(lines)
+
+    def _level(self, risk_analysis) -> dict:
+        return self.levels.get(risk_analysis.risk_level, self.levels["high"])
+
+    def subject(self, student_code: str, risk_analysis) -> str:
+        return self._level(risk_analysis)["subject"].format(student_code=student_code)
+
+    def render(self, student_code: str, risk_analysis) -> tuple:
+        """
+        Returns (texto del email, flags sin paso propio). Los flags sin plantilla (p.ej. textos
+        del modelo ML) se listan igualmente como indicadores.
+        """
+        level = self._level(risk_analysis)
+        steps, uncovered = self._steps(level["steps"], risk_analysis.flags)
+        indicators = "\n".join(f"- {flag}" for flag in risk_analysis.flags) or "- (sin indicadores específicos)"
+        plan = self._compose(
+            self.subject(student_code, risk_analysis),
+            level["intro"].format(student_code=student_code),
+            [("Indicadores detectados:", indicators), ("Resumen del análisis inicial:", risk_analysis.recommendation)],
+            steps
+        )
+        return plan, uncovered
+
+    def digest_subject(self, count: int) -> str:
+        return self.digest["subject"].format(count=count)
+
+    def render_digest(self, items: list) -> tuple:
+        """
+        Un único email para varias alertas de un mismo profesor. items: [(código alumno, RiskAnalysisResult)].
+        Alumnos de mayor a menor puntuación; un paso por cada flag presente en alguno. Returns (texto, flags sin paso).
+        """
+        items = sorted(items, key=lambda item: -item[1].total_score)
+        flags = list(dict.fromkeys(flag for _, analysis in items for flag in analysis.flags))
+        steps, uncovered = self._steps(self.digest["steps"], flags)
+        students = "\n".join(
+            f"- {code} (nivel {analysis.risk_level}, puntuación {analysis.total_score}): "
+            + ("; ".join(analysis.flags) or "sin indicadores específicos")
+            for code, analysis in items
+        )
+        plan = self._compose(
+            self.digest_subject(len(items)),
+            self.digest["intro"].format(count=len(items)),
+            [("Alumnos:", students)],
+            steps
+        )
+        return plan, uncovered
+
+    def with_enrichment(self, plan: str, enrichment: str) -> str:
+        # Las recomendaciones del LLM van antes de la despedida
+        if self.closing and plan.endswith(self.closing):
+            body = plan[:-len(self.closing)]
+            return f"{body}{self.enrichment_heading}\n{enrichment.strip()}\n\n{self.closing}"
+        return f"{plan}\n\n{self.enrichment_heading}\n{enrichment.strip()}"
+
+
+plan_templates = ActionPlanTemplates.load()
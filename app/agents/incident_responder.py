@@ -1,23 +1,70 @@
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
+import os
+import asyncio
+import hashlib
+from ..utils.cache import LRUCache
+from ..schemas import RiskAnalysisResult
+from .action_plans import plan_templates
+
+# Límites del camino de alerta: con un pico de alertas críticas, cada una tarda como mucho
+# LLM_QUEUE_TIMEOUT_S + LLM_TIMEOUT_S + EMAIL_TIMEOUT_S en vez de acumular hilos esperando
+LLM_MAX_CONCURRENCY = int(os.getenv("INCIDENT_LLM_CONCURRENCY", "4")) # Llamadas al LLM en vuelo (por proceso)
+LLM_QUEUE_TIMEOUT_S = float(os.getenv("INCIDENT_LLM_QUEUE_TIMEOUT_S", "10")) # Espera máx. por un hueco
+LLM_TIMEOUT_S = float(os.getenv("INCIDENT_LLM_TIMEOUT_S", "20"))
+EMAIL_TIMEOUT_S = float(os.getenv("INCIDENT_EMAIL_TIMEOUT_S", "30"))
+
+# El plan sale siempre de las plantillas (action_plans.json). El LLM solo lo enriquece:
+# "off" nunca, "needed" si algún flag no tiene paso en la plantilla, "always" en todas las alertas
+LLM_MODES = ("off", "needed", "always")
+LLM_MODE = os.getenv("INCIDENT_LLM_MODE", "needed")
+if LLM_MODE not in LLM_MODES:
+    raise ValueError(f"INCIDENT_LLM_MODE must be one of {LLM_MODES}")
+
+# Enriquecimientos por (nivel, flags ordenados, hash del resumen): no dependen del alumno
+ENRICHMENT_CACHE_SIZE = 1024
+
+class AlertDeliveryError(Exception):
+    """El email de la alerta no se pudo enviar (el dispatcher del outbox lo reintentará)."""
+
+class AlertDeliveryUnknown(AlertDeliveryError):
+    """
+    El envío superó EMAIL_TIMEOUT_S. El hilo de smtplib no se puede cancelar y el email puede
+    salir igualmente, así que no se reintenta (un reintento podría enviarlo dos veces).
+    """
 
 class IncidentResponder:
     """
     Agente especializado en Respuesta a Incidentes (Incident Response).
     Su objetivo es orquestar la reacción ante una alerta crítica:
-    1. Generar un Plan de Acción Inmediato (basado en la alerta).
+    1. Generar un Plan de Acción Inmediato (plantilla por nivel y flags, enriquecida con el LLM si hace falta).
     2. Notificar a las partes responsables (Profesor/Dirección).
     """
     
-    def __init__(self):
-        self.llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0.3)
+    def __init__(self, llm_mode: str = LLM_MODE):
+        self.llm_mode = llm_mode
+        self.chain = None
+        self._llm_slots = None
+        self._llm_slots_loop = None
+        self._enrichments = LRUCache(ENRICHMENT_CACHE_SIZE)
+        self._in_flight = {} # clave -> Task: alertas iguales a la vez comparten una sola llamada
+        if llm_mode == "off":
+            return
+        if not os.environ.get("OPENAI_API_KEY"):
+            print("WARNING: IncidentResponder sin LLM (falta OPENAI_API_KEY). Solo planes de plantilla")
+            return
+
+        # Import perezoso: sin LLM (tests, modo offline) no se carga LangChain
+        from langchain_openai import ChatOpenAI
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain_core.output_parsers import StrOutputParser
+
+        # El timeout del cliente corta la petición HTTP; wait_for en _enrich acota el total
+        self.llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0.3, timeout=LLM_TIMEOUT_S, max_retries=1)
         
-        # Prompt especializado en protocolos de actuación
+        # Prompt especializado en protocolos de actuación. Sin datos del alumno: el resultado se cachea
         self.plan_prompt = ChatPromptTemplate.from_template(
             """
             Actúas como un Coordinador de Bienestar y Protección del Menor.
-            Se ha detectado una ALERTA DE NIVEL: {risk_level} para el alumno {student_code}.
+            Se ha detectado una ALERTA DE NIVEL: {risk_level}.
             
             Indicadores detectados:
             {flags}
@@ -25,49 +72,137 @@ class IncidentResponder:
             Resumen del análisis inicial:
             {ai_summary}
             
-            Genera un PLAN DE ACCIÓN INMEDIATO (Email formal) dirigido al Profesor Tutor.
-            El email debe incluir:
-            1. Asunto Urgente.
-            2. Resumen de los hechos.
-            3. Lista de 3 pasosa seguir en las próximas 24 horas (basado en protocolos anti-acoso estándar).
-            4. Tono profesional, urgente pero calmado.
-            
-            Firma como: Agente de Respuesta a Incidentes - Sistema Anti-Bullying.
+            El profesor tutor ya recibe un plan de acción estándar (entrevista con el alumno,
+            aviso a orientación/dirección, contacto con la familia).
+            Escribe entre 2 y 4 recomendaciones ADICIONALES y concretas para estos indicadores,
+            basadas en protocolos anti-acoso estándar, como lista con guiones.
+            Sin saludo, sin asunto y sin firma. Tono profesional, urgente pero calmado.
             """
         )
         
         self.chain = self.plan_prompt | self.llm | StrOutputParser()
 
-    def handle_alert(self, student, risk_analysis, teacher_email: str):
+    def _slots(self) -> asyncio.Semaphore:
+        # Semáforo global de llamadas al LLM (uno por event loop: asyncio.Semaphore va ligado al loop)
+        loop = asyncio.get_running_loop()
+        if self._llm_slots_loop is not loop:
+            self._llm_slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+            self._llm_slots_loop = loop
+        return self._llm_slots
+
+    def _needs_llm(self, uncovered: list) -> bool:
+        if self.chain is None:
+            return False
+        return self.llm_mode == "always" or (self.llm_mode == "needed" and bool(uncovered))
+
+    @staticmethod
+    def enrichment_key(risk_analysis) -> tuple:
+        summary_hash = hashlib.blake2b(risk_analysis.recommendation.encode("utf-8"), digest_size=16).hexdigest()
+        return (risk_analysis.risk_level, tuple(sorted(risk_analysis.flags)), summary_hash)
+
+    async def _enrich(self, key: tuple, risk_analysis):
+        """Recomendaciones del LLM (semáforo + timeouts). None si no hay hueco, tarda demasiado o falla."""
+        slots = self._slots()
+        try:
+            await asyncio.wait_for(slots.acquire(), LLM_QUEUE_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            print("⏱️ [INCIDENT AGENT] LLM saturado, se envía el plan de plantilla")
+            return None
+        try:
+            enrichment = await asyncio.wait_for(self.chain.ainvoke({
+                "risk_level": risk_analysis.risk_level,
+                "flags": ", ".join(risk_analysis.flags),
+                "ai_summary": risk_analysis.recommendation
+            }), LLM_TIMEOUT_S)
+        except Exception as e:
+            print(f"⚠️ [INCIDENT AGENT] LLM no disponible ({type(e).__name__}), se envía el plan de plantilla")
+            return None
+        finally:
+            slots.release()
+        if enrichment:
+            self._enrichments.put(key, enrichment) # Los fallos no se cachean: se reintenta en la siguiente alerta
+        return enrichment
+
+    async def aenrichment(self, risk_analysis):
+        key = self.enrichment_key(risk_analysis)
+        cached = self._enrichments.get(key)
+        if cached is not None:
+            return cached
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._enrich(key, risk_analysis))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def agenerate_plan(self, student_code: str, risk_analysis) -> str:
+        """Plan de plantilla (instantáneo); el LLM solo añade recomendaciones si llm_mode lo pide."""
+        plan, uncovered = plan_templates.render(student_code, risk_analysis)
+        if not self._needs_llm(uncovered):
+            return plan
+        enrichment = await self.aenrichment(risk_analysis)
+        return plan_templates.with_enrichment(plan, enrichment) if enrichment else plan
+
+    async def agenerate_digest(self, items: list) -> str:
+        """Un plan para varias alertas (items: [(código, análisis)]); como mucho una llamada al LLM."""
+        plan, uncovered = plan_templates.render_digest(items)
+        if not self._needs_llm(uncovered):
+            return plan
+        # Un único "análisis" con todos los indicadores: la clave de caché no depende de los alumnos
+        combined = RiskAnalysisResult(
+            total_score=max(analysis.total_score for _, analysis in items),
+            risk_level=items[0][1].risk_level,
+            flags=sorted({flag for _, analysis in items for flag in analysis.flags}),
+            recommendation=" ".join(dict.fromkeys(analysis.recommendation for _, analysis in items))
+        )
+        enrichment = await self.aenrichment(combined)
+        return plan_templates.with_enrichment(plan, enrichment) if enrichment else plan
+
+    async def _asend(self, teacher_email: str, content: str, subject: str = None):
+        # smtplib es bloqueante: en un hilo, con tiempo máximo. wait_for deja de esperar pero no
+        # detiene el hilo: tras un timeout el resultado es desconocido (AlertDeliveryUnknown)
+        try:
+            sent = await asyncio.wait_for(asyncio.to_thread(self._send_email, teacher_email, content, subject), EMAIL_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            raise AlertDeliveryUnknown(f"Email to {teacher_email} timed out after {EMAIL_TIMEOUT_S:.0f}s, delivery unknown")
+        if not sent:
+            raise AlertDeliveryError(f"Email to {teacher_email} was not sent")
+
+    async def ahandle_digest(self, teacher_email: str, items: list) -> str:
+        """Resumen de varias alertas de riesgo alto para un mismo profesor: un plan y un email."""
+        print(f"🚨 [INCIDENT AGENT] Resumen de {len(items)} alertas para {teacher_email}")
+        digest_email = await self.agenerate_digest(items)
+        await self._asend(teacher_email, digest_email, plan_templates.digest_subject(len(items)))
+        return digest_email
+
+    async def ahandle_alert(self, student_code: str, risk_analysis, teacher_email: str) -> str:
         """
-        Método principal que orquesta la respuesta.
+        Método principal que orquesta la respuesta. Lo ejecuta el dispatcher del outbox
+        (app/alert_outbox.py), no el proceso web. Lanza AlertDeliveryError si el email no sale
+        (AlertDeliveryUnknown si no se sabe).
         """
-        print(f"🚨 [INCIDENT AGENT] Activado para estudiante {student.internal_code}")
+        print(f"🚨 [INCIDENT AGENT] Activado para estudiante {student_code}")
         
-        # 1. Generar Plan con LLM
-        action_plan_email = self.chain.invoke({
-            "risk_level": risk_analysis.risk_level,
-            "student_code": student.internal_code,
-            "flags": ", ".join(risk_analysis.flags),
-            "ai_summary": risk_analysis.recommendation
-        })
+        # 1. Generar Plan (plantilla + LLM opcional, acotado en concurrencia y tiempo)
+        action_plan_email = await self.agenerate_plan(student_code, risk_analysis)
         
-        # 2. Enviar Notificación (Simulada)
-        self._send_email(teacher_email, action_plan_email)
+        # 2. Enviar Notificación
+        await self._asend(teacher_email, action_plan_email, plan_templates.subject(student_code, risk_analysis))
         
         return action_plan_email
 
-    def _send_email(self, to_email: str, content: str):
+    def _send_email(self, to_email: str, content: str, subject: str = None) -> bool:
         # Enviar correo real usando utilidad SMTP
+        sent = False
         try:
             from ..utils.email import send_email
             # Extract basic subject or use default
-            subject = "🚨 ALERTA ANTIBULLYING: Acción Requerida"
+            subject = subject or "🚨 ALERTA ANTIBULLYING: Acción Requerida"
             
             # Convierte saltos de linea a <br> para HTML básico si es texto plano
             html_content = content.replace("\n", "<br>")
             
-            send_email(to_email, subject, html_content)
+            sent = send_email(to_email, subject, html_content)
             
         except Exception as e:
             print(f"❌ Error enviando email SMTP: {e}")
@@ -77,5 +212,6 @@ class IncidentResponder:
         print("---------------------------------------------------")
         print(content)
         print("---------------------------------------------------\n")
+        return sent
 
 incident_responder = IncidentResponder()
@@ -1,10 +1,65 @@
+from typing import NamedTuple
+from collections import defaultdict
+import numpy as np
 from ..schemas import SurveyInput, RiskAnalysisResult, Frequency, YesNo
 from ..models import AlertLevel
+from .rules import rule_plan, RISK_LEVELS
+from ..utils.text_analysis import score_text_risk
+
+# --- Modo bulk (columnar) ---
+# Orden de columnas de las matrices que acepta HeuristicPredictor.analyze_bulk (definido en risk_rules.json)
+PARENT_FIELDS = rule_plan.modes["parent"].fields
+TEACHER_FIELDS = rule_plan.modes["teacher"].fields
+
+
+def answers_to_matrix(answers_list, fields):
+    """Lista de dicts (raw_answers) -> matriz int (N, len(fields)); ausentes/None = 0."""
+    matrix = np.zeros((len(answers_list), len(fields)), dtype=np.int64)
+    for row, answers in enumerate(answers_list):
+        matrix[row] = [answers.get(f) or 0 for f in fields]
+    return matrix
+
+
+def decode_flags(mask: int, sentiment_boost: int = 0, text_boost: int = 0) -> list:
+    """Bitmask -> lista de textos de flags, en el orden de risk_rules.json."""
+    return rule_plan.decode_flags(mask, sentiment_boost, text_boost)
+
+
+def answers_to_text_risk(answers_list, field):
+    """Lista de dicts -> array (N,) con score_text_risk del campo de texto libre (cacheado por hash)."""
+    return np.array([score_text_risk(answers.get(field)) for answers in answers_list], dtype=np.float64)
+
+
+def survey_text_risk(answers: dict):
+    """text_risk con el que se puntúa la encuesta (text_field de su modo); None si el modo no tiene texto libre."""
+    mode = rule_plan.mode_for(answers)
+    return score_text_risk(answers.get(mode.text_field)) if mode.text_field else None
+
+
+class BulkRiskResult(NamedTuple):
+    scores: np.ndarray # int (N,)
+    levels: np.ndarray # int8 (N,) índice en RISK_LEVELS
+    flags: np.ndarray # uint16 (N,) bitmask (bits en rule_plan.flag_bits)
+    sentiment_boost: np.ndarray # int (N,)
+    text_boost: np.ndarray # int (N,)
+
+    def risk_levels(self) -> list:
+        return [RISK_LEVELS[i].value for i in self.levels]
+
+    def result(self, row: int) -> RiskAnalysisResult:
+        level = RISK_LEVELS[self.levels[row]]
+        return RiskAnalysisResult(
+            total_score=int(self.scores[row]),
+            risk_level=level.value,
+            flags=decode_flags(int(self.flags[row]), int(self.sentiment_boost[row]), int(self.text_boost[row])),
+            recommendation=HeuristicPredictor._get_recommendation(level)
+        )
 
 class HeuristicPredictor:
     """
     Motor de análisis basado en reglas (Adaptación TEBAE).
     Calcula el riesgo basándose en pesos predefinidos ante la falta de datos históricos.
+    Bloques, pesos, umbrales y flags se definen en risk_rules.json (ver agents/rules.py).
     """
     
     # Pesos de configuración
@@ -15,106 +70,56 @@ class HeuristicPredictor:
         Frequency.ALWAYS_CORRECTED: 3
     }
 
-    # Umbrales
-    threshold_CRITICAL = 12 # Puntuación muy alta
-    THRESHOLD_HIGH = 8
-    THRESHOLD_MEDIUM = 4
-
     def analyze(self, data: SurveyInput, teacher_sentiment: float = 0.0) -> RiskAnalysisResult:
-        score = 0
-        flags = []
-        
-        # --- Lógica Profesor (Si hay datos de profesor) ---
-        if data.t_vic_insults is not None:
-             # Scoring simple: Suma directa de valores 0-4
-             # A. Victimización
-             vic_score = sum([
-                 data.t_vic_insults or 0, data.t_vic_exclusion or 0, 
-                 data.t_vic_physical or 0, data.t_vic_theft or 0, 
-                 data.t_vic_rumors or 0, data.t_vic_threats or 0
-             ])
-             
-             # B. Agresión
-             agg_score = sum([
-                 data.t_agg_insults or 0, data.t_agg_exclusion or 0,
-                 data.t_agg_physical or 0, data.t_agg_theft or 0,
-                 data.t_agg_rumors or 0
-             ])
-             
-             # C. Cyber
-             cyber_score = sum([data.t_cyber_messages or 0, data.t_cyber_anxiety or 0])
-             
-             score = vic_score + agg_score + cyber_score
-             
-             if vic_score > 10: flags.append("Alta Victimización detectada")
-             if agg_score > 10: flags.append("Comportamiento Agresor detectado")
-             if cyber_score > 4: flags.append("Indicios de Ciberacoso")
-
-             # Umbrales Profesor (Max 52)
-             if score > 25: risk_level = AlertLevel.CRITICAL
-             elif score > 15: risk_level = AlertLevel.HIGH
-             elif score > 8: risk_level = AlertLevel.MEDIUM
-             else: risk_level = AlertLevel.LOW
-             
-        # --- Lógica Padres (Default: Items p_item_1...13) ---
-        else:
-            # Block A: Directos y Materiales (Items 1-5)
-            score_a = sum([
-                data.p_item_1 or 0, data.p_item_2 or 0, data.p_item_3 or 0, 
-                data.p_item_4 or 0, data.p_item_5 or 0
-            ])
-            
-            # Block B: Psicosomáticos (Items 6-10)
-            score_b = sum([
-                data.p_item_6 or 0, data.p_item_7 or 0, data.p_item_8 or 0,
-                data.p_item_9 or 0, data.p_item_10 or 0
-            ])
-            
-            # Block C: Ciberacoso (Items 11-13)
-            score_c = sum([
-                data.p_item_11 or 0, data.p_item_12 or 0, data.p_item_13 or 0
-            ])
-            
-            score = score_a + score_b + score_c
-            
-            # Flags específicos
-            if score_a > 8: flags.append("Indicadores Directos/Físicos Altos")
-            if score_b > 10: flags.append("Alto Malestar Psicosomático")
-            if score_c > 5: flags.append("Indicios de Ciberacoso")
-            
-            # Alerta inmediata si items críticos tienen valor alto (ej: Heridas=4)
-            if (data.p_item_2 or 0) >= 3 or (data.p_item_5 or 0) >= 3:
-                flags.append("Marcador Crítico Detectado (Heridas/Coacción)")
-                risk_level = AlertLevel.CRITICAL
-            
-            # Umbrales (Max 52)
-            # Umbrales (Max 52)
-            # Modificador: Si el ambiente escolar (Profesor) es negativo, bajamos los umbrales o subimos el score.
-            # teacher_sentiment va de 0.0 (Bien) a 1.0 (Mal)
-            
-            sentiment_boost = 0
-            if teacher_sentiment > 0.3:
-                sentiment_boost = int(teacher_sentiment * 10) # Max +10 puntos
-                score += sentiment_boost
-                flags.append(f"Ambiente de Clase Negativo (+{sentiment_boost})")
-
-            # Evaluar nivel de riesgo final
-            if score > 25: risk_level = AlertLevel.CRITICAL
-            elif score > 15: risk_level = AlertLevel.HIGH
-            elif score > 8: risk_level = AlertLevel.MEDIUM
-            else: risk_level = AlertLevel.LOW
-
-        # Recomendación básica (será enriquecida luego por el RAG)
-        recommendation = self._get_recommendation(risk_level)
-
+        # Mismo plan compilado que analyze_bulk (reglas en risk_rules.json), recorrido en Python:
+        # para una sola encuesta crear matrices NumPy cuesta más que evaluarla
+        answers = vars(data) # Mismos valores que model_dump() sin copiarlos
+        mode = rule_plan.mode_for(answers)
+        text_risk = score_text_risk(answers.get(mode.text_field)) if mode.text_field else None
+        score, level_idx, flags, boost, text_boost = mode.evaluate_one(answers, teacher_sentiment, text_risk)
+        level = RISK_LEVELS[level_idx]
         return RiskAnalysisResult(
             total_score=score,
-            risk_level=risk_level.value,
-            flags=flags,
-            recommendation=recommendation
+            risk_level=level.value,
+            flags=decode_flags(flags, boost, text_boost),
+            recommendation=self._get_recommendation(level)
         )
 
-    def _get_recommendation(self, level: AlertLevel) -> str:
+    def analyze_bulk(self, items, teacher_sentiment=None, teacher: bool = False, text_risk=None) -> BulkRiskResult:
+        """
+        Versión vectorizada de analyze() para re-puntuar muchas encuestas a la vez.
+        items: (N, 13) en el orden de PARENT_FIELDS (o TEACHER_FIELDS si teacher=True); None/NaN = 0.
+        teacher_sentiment: escalar o (N,), solo aplica a encuestas de padres.
+        text_risk: escalar o (N,), ver answers_to_text_risk (campo text_field del modo).
+        """
+        mode = rule_plan.modes["teacher" if teacher else "parent"]
+        return BulkRiskResult(*mode.evaluate(items, teacher_sentiment, text_risk))
+
+    def analyze_many(self, answers_list, teacher_sentiments=None) -> list:
+        """
+        analyze() para una lista de encuestas (dicts, p.ej. SurveyInput.model_dump()),
+        con una sola evaluación vectorizada por tipo de encuesta. Mismo resultado que analyze() fila a fila.
+        teacher_sentiments: None o (N,).
+        """
+        results = [None] * len(answers_list)
+        groups = defaultdict(list)
+        for row, answers in enumerate(answers_list):
+            groups[rule_plan.mode_for(answers).name].append(row)
+
+        for name, rows in groups.items():
+            mode = rule_plan.modes[name]
+            group = [answers_list[row] for row in rows]
+            sentiment = None
+            if teacher_sentiments is not None:
+                sentiment = np.asarray(teacher_sentiments, dtype=np.float64)[rows]
+            text_risk = answers_to_text_risk(group, mode.text_field) if mode.text_field else None
+            bulk = BulkRiskResult(*mode.evaluate(answers_to_matrix(group, mode.fields), sentiment, text_risk))
+            for i, row in enumerate(rows):
+                results[row] = bulk.result(i)
+        return results
+
+    @staticmethod
+    def _get_recommendation(level: AlertLevel) -> str:
         if level == AlertLevel.CRITICAL:
             return "ALERTA: Se detectan indicadores graves. Se requiere intervención inmediata del centro."
         elif level == AlertLevel.HIGH:
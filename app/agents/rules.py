@@ -0,0 +1,232 @@
+import os
+import json
+import numpy as np
+from ..models import AlertLevel
+
+RULES_PATH = os.getenv("RISK_RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "risk_rules.json"))
+
+# Índice de nivel -> AlertLevel (nivel = nº de umbrales superados)
+RISK_LEVELS = [AlertLevel.LOW, AlertLevel.MEDIUM, AlertLevel.HIGH, AlertLevel.CRITICAL]
+THRESHOLD_KEYS = ["medium", "high", "critical"]
+
+
+class CompiledMode:
+    """
+    Plan de evaluación plano para un tipo de encuesta (padres / profesor):
+    matriz de pertenencia bloque x campo, pesos, umbrales de flag y de nivel como arrays.
+    Evaluar N encuestas es un producto de matrices y unas comparaciones, sin importar cuántas reglas haya.
+    """
+
+    def __init__(self, name: str, config: dict, flag_bits: dict):
+        self.name = name
+        self.detect_field = config.get("detect_field")
+
+        blocks = config["blocks"]
+        # Campos en orden de aparición: define las columnas de la matriz de entrada
+        self.fields = []
+        for block in blocks:
+            for field in block["fields"]:
+                if field not in self.fields:
+                    self.fields.append(field)
+        index = {f: i for i, f in enumerate(self.fields)}
+
+        self.membership = np.zeros((len(blocks), len(self.fields)), dtype=np.int64)
+        for b, block in enumerate(blocks):
+            self.membership[b, [index[f] for f in block["fields"]]] = 1
+        self.weights = np.array([block.get("weight", 1) for block in blocks], dtype=np.float64)
+        self.block_flag_bits = np.array([flag_bits[block["flag"]] if block.get("flag") else 0 for block in blocks], dtype=np.uint16)
+        self.block_flag_above = np.array([block.get("flag_above", np.inf) for block in blocks], dtype=np.float64)
+
+        critical = config.get("critical_items")
+        self.critical_idx = np.array([index[f] for f in critical["fields"]] if critical else [], dtype=np.int64)
+        self.critical_min = critical["min_value"] if critical else 0
+        self.critical_bit = flag_bits[critical["flag"]] if critical and critical.get("flag") else 0
+        force_level = critical.get("force_level") if critical else None
+        self.critical_force_level = RISK_LEVELS.index(AlertLevel(force_level)) if force_level else -1
+
+        boost = config.get("sentiment_boost")
+        self.sentiment_above = boost["above"] if boost else None
+        self.sentiment_multiplier = boost["multiplier"] if boost else 0
+        self.sentiment_bit = flag_bits[boost["flag"]] if boost and boost.get("flag") else 0
+
+        text = config.get("text_boost")
+        self.text_field = text["field"] if text else None
+        self.text_above = text["above"] if text else None
+        self.text_multiplier = text["multiplier"] if text else 0
+        self.text_bit = flag_bits[text["flag"]] if text and text.get("flag") else 0
+
+        thresholds = [config["thresholds"][k] for k in THRESHOLD_KEYS]
+        if thresholds != sorted(thresholds):
+            raise ValueError(f"Thresholds for '{name}' must be ascending (medium <= high <= critical)")
+        self.thresholds = np.array(thresholds, dtype=np.float64)
+
+        # Mismo plan como listas Python para evaluate_one (una encuesta: sin coste de crear arrays)
+        self._block_fields = [[self.fields[i] for i in np.flatnonzero(row)] for row in self.membership]
+        self._block_rules = list(zip(
+            self._block_fields, self.weights.tolist(), self.block_flag_bits.tolist(), self.block_flag_above.tolist()
+        ))
+        self._critical_fields = [self.fields[i] for i in self.critical_idx]
+        self._threshold_list = self.thresholds.tolist()
+
+    def evaluate(self, items, teacher_sentiment=None, text_risk=None):
+        """
+        items: (N, len(fields)). text_risk: escalar o (N,) en 0..1 (texto libre de text_field).
+        Returns (scores, levels, flags, sentiment_boost, text_boost) como arrays.
+        """
+        items = np.nan_to_num(np.asarray(items, dtype=np.float64)).astype(np.int64)
+        n = len(items)
+
+        # 1. Sumas por bloque (una multiplicación) y score ponderado
+        block_scores = items @ self.membership.T
+        scores = np.rint(block_scores @ self.weights).astype(np.int64)
+
+        # 2. Flags por bloque: bit si la suma del bloque supera su umbral
+        flags = np.bitwise_or.reduce(
+            np.where(block_scores > self.block_flag_above, self.block_flag_bits, 0).astype(np.uint16),
+            axis=1
+        ) if len(self.block_flag_bits) else np.zeros(n, dtype=np.uint16)
+        flags = flags.astype(np.uint16)
+
+        # 3. Items críticos
+        critical = np.zeros(n, dtype=bool)
+        if len(self.critical_idx):
+            critical = (items[:, self.critical_idx] >= self.critical_min).any(axis=1)
+            flags |= np.where(critical, self.critical_bit, 0).astype(np.uint16)
+
+        # 4. Ajuste por ambiente de clase
+        boost = np.zeros(n, dtype=np.int64)
+        if self.sentiment_above is not None and teacher_sentiment is not None:
+            sentiment = np.broadcast_to(np.asarray(teacher_sentiment, dtype=np.float64), (n,))
+            negative = sentiment > self.sentiment_above
+            boost = np.where(negative, (sentiment * self.sentiment_multiplier).astype(np.int64), 0)
+            scores = scores + boost
+            flags |= np.where(negative, self.sentiment_bit, 0).astype(np.uint16)
+
+        # 5. Indicadores en el texto libre (observaciones)
+        text_boost = np.zeros(n, dtype=np.int64)
+        if self.text_above is not None and text_risk is not None:
+            text_risk = np.broadcast_to(np.asarray(text_risk, dtype=np.float64), (n,))
+            risky = text_risk > self.text_above
+            text_boost = np.where(risky, (text_risk * self.text_multiplier).astype(np.int64), 0)
+            scores = scores + text_boost
+            flags |= np.where(risky, self.text_bit, 0).astype(np.uint16)
+
+        # 6. Nivel = nº de umbrales superados
+        levels = (scores[:, None] > self.thresholds).sum(axis=1).astype(np.int8)
+        if self.critical_force_level >= 0:
+            levels = np.where(critical, np.maximum(levels, self.critical_force_level), levels).astype(np.int8)
+
+        return scores, levels, flags, boost, text_boost
+
+    def evaluate_one(self, answers: dict, teacher_sentiment=None, text_risk=None) -> tuple:
+        """
+        evaluate() para una sola encuesta (dict de respuestas), en Python puro.
+        Returns (score, nivel, flags, sentiment_boost, text_boost) como ints; mismo resultado que evaluate().
+        """
+        get = answers.get
+        weighted = 0.0
+        flags = 0
+        for fields, weight, bit, above in self._block_rules:
+            block_score = 0
+            for f in fields:
+                value = get(f)
+                if value:
+                    block_score += int(value)
+            weighted += block_score * weight
+            if block_score > above:
+                flags |= bit
+        score = int(round(weighted)) # round() redondea a par, como np.rint
+
+        critical = False
+        for f in self._critical_fields:
+            if int(get(f) or 0) >= self.critical_min:
+                critical = True
+                flags |= self.critical_bit
+                break
+
+        boost = 0
+        if self.sentiment_above is not None and teacher_sentiment is not None and teacher_sentiment > self.sentiment_above:
+            boost = int(teacher_sentiment * self.sentiment_multiplier)
+            score += boost
+            flags |= self.sentiment_bit
+
+        text_boost = 0
+        if self.text_above is not None and text_risk is not None and text_risk > self.text_above:
+            text_boost = int(text_risk * self.text_multiplier)
+            score += text_boost
+            flags |= self.text_bit
+
+        level = sum(1 for threshold in self._threshold_list if score > threshold)
+        if critical and self.critical_force_level >= 0:
+            level = max(level, self.critical_force_level)
+        return score, level, flags, boost, text_boost
+
+
+class RulePlan:
+    """Reglas cargadas de risk_rules.json y compiladas una sola vez."""
+
+    def __init__(self, config: dict):
+        # Un bit por flag, en el orden del fichero: decodificar en orden de bit conserva el orden de los textos
+        self.flag_labels = list(config["flags"].values())
+        self.flag_bits = {key: 1 << i for i, key in enumerate(config["flags"])}
+        if len(self.flag_bits) > 16:
+            raise ValueError("At most 16 flags are supported (uint16 bitmask)")
+
+        self.modes = {name: CompiledMode(name, mode, self.flag_bits) for name, mode in config["modes"].items()}
+
+        nets = config.get("ml_safety_nets", [])
+        self.safety_net_fields = [net["field"] for net in nets]
+        self.safety_net_min_values = np.array([net["min_value"] for net in nets], dtype=np.float64)
+        self.safety_net_min_probs = np.array([net["min_probability"] for net in nets], dtype=np.float64)
+        self.safety_net_messages = [net["message"] for net in nets]
+
+    @classmethod
+    def load(cls, path: str = RULES_PATH):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def mode_for(self, answers: dict) -> CompiledMode:
+        """Modo profesor si su detect_field viene relleno; si no, padres."""
+        for mode in self.modes.values():
+            if mode.detect_field and answers.get(mode.detect_field) is not None:
+                return mode
+        return self.modes["parent"]
+
+    def decode_flags(self, mask: int, sentiment_boost: int = 0, text_boost: int = 0) -> list:
+        return [
+            label.format(boost=sentiment_boost, text_boost=text_boost)
+            for i, label in enumerate(self.flag_labels)
+            if mask & (1 << i)
+        ]
+
+    def flag_keys(self, labels: list) -> tuple:
+        """Textos de flags -> claves de risk_rules.json. Returns (claves, textos no reconocidos)."""
+        prefixes = [(label.split("{")[0], key) for label, key in zip(self.flag_labels, self.flag_bits)]
+        keys, unknown = [], []
+        for label in labels:
+            key = next((key for prefix, key in prefixes if label.startswith(prefix)), None)
+            if key is None:
+                unknown.append(label)
+            elif key not in keys:
+                keys.append(key)
+        return keys, unknown
+
+    def apply_safety_nets(self, X, probs, feature_columns):
+        """
+        Reglas de oro del modelo ML, vectorizadas. La primera regla que se cumple gana
+        (fija el mensaje y la probabilidad mínima). Returns (probs, explanation_prefixes).
+        """
+        probs = np.asarray(probs, dtype=np.float64)
+        prefixes = np.full(len(X), "", dtype=object)
+        matched = np.zeros(len(X), dtype=bool)
+        for field, min_value, min_prob, message in zip(
+            self.safety_net_fields, self.safety_net_min_values, self.safety_net_min_probs, self.safety_net_messages
+        ):
+            hit = (X[:, feature_columns.index(field)] >= min_value) & ~matched
+            probs = np.where(hit, np.maximum(probs, min_prob), probs)
+            prefixes[hit] = message
+            matched |= hit
+        return probs, prefixes
+
+
+rule_plan = RulePlan.load()
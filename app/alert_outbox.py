@@ -0,0 +1,284 @@
+import os
+import time
+import uuid
+import random
+import asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, func, or_, case, true
+from sqlalchemy.orm import Session
+from .models import AlertOutbox, OutboxStatus, AlertLevel
+from .database import SessionLocal
+
+# Niveles que generan alerta al profesor
+ALERT_LEVELS = ("high", "critical")
+DEFAULT_TEACHER_EMAIL = "profesor_demo@colegio.com"
+
+MAX_ATTEMPTS = int(os.getenv("ALERT_MAX_ATTEMPTS", "5"))
+BACKOFF_BASE_S = 30 # 30s, 60s, 120s... (con jitter), hasta BACKOFF_MAX_S
+BACKOFF_MAX_S = 3600
+# Una alerta en PROCESSING más tiempo que esto es de un dispatcher caído: vuelve a PENDING
+CLAIM_LEASE_S = int(os.getenv("ALERT_CLAIM_LEASE_S", "600"))
+# Coalescing: las alertas críticas salen en cuanto se reclaman; las de riesgo alto esperan hasta
+# ALERT_DIGEST_WINDOW_MIN minutos y todas las de un mismo profesor van en un único resumen
+# (un plan, un email). 0 = cada alerta por separado.
+DIGEST_WINDOW_MIN = float(os.getenv("ALERT_DIGEST_WINDOW_MIN", "15"))
+# Cada cuánto borra el dispatcher las claves de idempotencia caducadas (app/idempotency.py)
+KEY_PRUNE_INTERVAL_S = 3600
+
+
+# --- Lado web: encolar en la misma transacción que la encuesta ---
+
+def needs_alert(student, analysis) -> bool:
+    return analysis.risk_level in ALERT_LEVELS and bool(student.teacher_id)
+
+
+def outbox_values(student, analysis, survey_id=None) -> dict:
+    """Columnas de la fila de outbox (sirve para AlertOutbox(**values) y para un INSERT masivo)."""
+    recipient = DEFAULT_TEACHER_EMAIL
+    if student.teacher and student.teacher.email:
+        recipient = student.teacher.email
+    return {
+        "survey_id": survey_id,
+        "student_id": student.id,
+        "student_code": student.internal_code,
+        "recipient_email": recipient,
+        "risk_level": AlertLevel(analysis.risk_level),
+        "payload": analysis.model_dump_json(),
+        "status": OutboxStatus.PENDING,
+        "attempts": 0,
+        "next_attempt_at": datetime.utcnow(),
+    }
+
+
+# --- Lado dispatcher (proceso aparte: scripts/run_alert_dispatcher.py) ---
+
+def backoff_delay(attempts: int) -> float:
+    delay = min(BACKOFF_BASE_S * 2 ** max(attempts - 1, 0), BACKOFF_MAX_S)
+    return delay * random.uniform(0.8, 1.2) # Jitter: los reintentos de un pico no vuelven todos a la vez
+
+
+def release_stale_claims(db: Session, now: datetime = None) -> int:
+    now = now or datetime.utcnow()
+    result = db.execute(
+        update(AlertOutbox)
+        .where(AlertOutbox.status == OutboxStatus.PROCESSING, AlertOutbox.claimed_at < now - timedelta(seconds=CLAIM_LEASE_S))
+        .values(status=OutboxStatus.PENDING, claimed_by=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+def claim_batch(db: Session, batch_size: int, now: datetime = None, digest_window_min: float = DIGEST_WINDOW_MIN) -> list:
+    """
+    Reclama hasta batch_size alertas vencidas con un único UPDATE (atómico: dos dispatchers
+    nunca reclaman la misma fila) y devuelve las reclamadas. Cuenta el intento al reclamar.
+    Las críticas primero. Con ventana de resumen, una alerta alta solo vence cuando cumple la
+    ventana, y entonces se reclaman con ella todas las altas pendientes del mismo profesor.
+    """
+    now = now or datetime.utcnow()
+    token = uuid.uuid4().hex
+    claim = dict(status=OutboxStatus.PROCESSING, claimed_by=token, claimed_at=now, attempts=AlertOutbox.attempts + 1)
+    is_high = AlertOutbox.risk_level == AlertLevel.HIGH
+
+    ready = true()
+    if digest_window_min > 0:
+        ready = or_(~is_high, AlertOutbox.attempts > 0, AlertOutbox.created_at <= now - timedelta(minutes=digest_window_min))
+    due = (
+        select(AlertOutbox.id)
+        .where(AlertOutbox.status == OutboxStatus.PENDING, AlertOutbox.next_attempt_at <= now, ready)
+        .order_by(case((AlertOutbox.risk_level == AlertLevel.CRITICAL, 0), else_=1), AlertOutbox.next_attempt_at, AlertOutbox.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True) # PostgreSQL; SQLite ya serializa las escrituras
+    )
+    db.execute(
+        update(AlertOutbox)
+        .where(AlertOutbox.id.in_(due), AlertOutbox.status == OutboxStatus.PENDING)
+        .values(**claim)
+        .execution_options(synchronize_session=False)
+    )
+
+    if digest_window_min > 0:
+        # El resto de altas de esos profesores, aunque su ventana no haya terminado: van en el mismo resumen.
+        # Las que esperan un reintento (backoff) no se adelantan
+        recipients = select(AlertOutbox.recipient_email).where(AlertOutbox.claimed_by == token, is_high)
+        db.execute(
+            update(AlertOutbox)
+            .where(AlertOutbox.status == OutboxStatus.PENDING, is_high, AlertOutbox.next_attempt_at <= now,
+                   AlertOutbox.recipient_email.in_(recipients))
+            .values(**claim)
+            .execution_options(synchronize_session=False)
+        )
+    db.commit()
+    return db.execute(select(AlertOutbox).where(AlertOutbox.claimed_by == token)).scalars().all()
+
+
+def coalesce(alerts: list, digest_window_min: float = DIGEST_WINDOW_MIN) -> list:
+    """Agrupa las alertas reclamadas en envíos: cada crítica sola, las altas de un mismo profesor juntas."""
+    if digest_window_min <= 0:
+        return [[alert] for alert in alerts]
+    groups = []
+    digests = {}
+    for alert in alerts:
+        if alert.risk_level == AlertLevel.HIGH:
+            if alert.recipient_email not in digests:
+                digests[alert.recipient_email] = []
+                groups.append(digests[alert.recipient_email])
+            digests[alert.recipient_email].append(alert)
+        else:
+            groups.append([alert])
+    return groups
+
+
+def record_results(db: Session, results: list, now: datetime = None):
+    """
+    results: [(alerta, error o None, reintentar)]. Enviada -> SENT; fallo -> PENDING con backoff o FAILED.
+    Un fallo que no se debe reintentar (envío con resultado desconocido) -> SENT, con el error en last_error.
+    """
+    now = now or datetime.utcnow()
+    rows = []
+    for alert, error, retry in results:
+        if error is None or not retry:
+            rows.append({"id": alert.id, "status": OutboxStatus.SENT, "sent_at": now, "last_error": error, "claimed_by": None})
+        elif alert.attempts >= MAX_ATTEMPTS:
+            rows.append({"id": alert.id, "status": OutboxStatus.FAILED, "last_error": error, "claimed_by": None})
+        else:
+            rows.append({
+                "id": alert.id, "status": OutboxStatus.PENDING, "last_error": error, "claimed_by": None,
+                "next_attempt_at": now + timedelta(seconds=backoff_delay(alert.attempts))
+            })
+    if rows:
+        db.execute(update(AlertOutbox), rows)
+        db.commit()
+
+
+def outbox_stats(db: Session) -> dict:
+    counts = dict(db.execute(select(AlertOutbox.status, func.count()).group_by(AlertOutbox.status)).all())
+    return {status.value: counts.get(status, 0) for status in OutboxStatus}
+
+
+def retry_failed(db: Session) -> int:
+    """Devuelve las alertas FAILED a la cola (p.ej. tras arreglar las credenciales SMTP)."""
+    result = db.execute(
+        update(AlertOutbox)
+        .where(AlertOutbox.status == OutboxStatus.FAILED)
+        .values(status=OutboxStatus.PENDING, attempts=0, next_attempt_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+class AlertDispatcher:
+    """
+    Procesa el outbox: reclama alertas por lotes, las agrupa (coalesce) y ejecuta
+    IncidentResponder.ahandle_alert / ahandle_digest (plan + email) con concurrencia acotada,
+    guardando el resultado de cada alerta.
+    Todo corre en un único event loop; las llamadas al LLM además comparten el semáforo global del responder.
+    """
+
+    def __init__(self, batch_size: int = 20, concurrency: int = 4, poll_interval: float = 2.0,
+                 session_factory=SessionLocal, responder=None, digest_window_min: float = DIGEST_WINDOW_MIN):
+        self.batch_size = batch_size
+        self.digest_window_min = digest_window_min
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.session_factory = session_factory
+        self._responder = responder
+        self._keys_pruned_at = None
+
+    @property
+    def responder(self):
+        # Import perezoso: solo el dispatcher carga LangChain / el cliente del LLM
+        if self._responder is None:
+            from .agents.incident_responder import incident_responder
+            self._responder = incident_responder
+        return self._responder
+
+    async def _deliver(self, slots: asyncio.Semaphore, group: list):
+        """Un envío: una alerta o el resumen de varias. Returns (error o None, reintentar), común a todo el grupo."""
+        from .schemas import RiskAnalysisResult
+        from .agents.incident_responder import AlertDeliveryUnknown
+        # Se leen los datos antes de esperar: las filas ORM no se tocan desde otras corrutinas
+        recipient = group[0].recipient_email
+        items = [(alert.student_code, RiskAnalysisResult.model_validate_json(alert.payload)) for alert in group]
+        ids = [alert.id for alert in group]
+        async with slots:
+            try:
+                if len(items) == 1:
+                    await self.responder.ahandle_alert(items[0][0], items[0][1], recipient)
+                else:
+                    await self.responder.ahandle_digest(recipient, items)
+                return None, False
+            except AlertDeliveryUnknown as e:
+                # El email pudo salir: se da por enviado antes que arriesgar un duplicado
+                print(f"⚠️ Alerts {ids} not retried: {e}")
+                return f"{type(e).__name__}: {e}"[:1000], False
+            except Exception as e:
+                print(f"❌ Alerts {ids} failed: {e}")
+                return f"{type(e).__name__}: {e}"[:1000], True
+
+    def _prune_keys(self, db: Session):
+        if self._keys_pruned_at is not None and time.monotonic() - self._keys_pruned_at < KEY_PRUNE_INTERVAL_S:
+            return
+        from .idempotency import prune_submission_keys
+        pruned = prune_submission_keys(db)
+        self._keys_pruned_at = time.monotonic()
+        if pruned:
+            print(f"🧹 Pruned {pruned} expired idempotency keys")
+
+    async def arun_once(self) -> dict:
+        """Un lote. Returns {"claimed", "sent", "failed", "emails"} (emails = envíos tras agrupar)."""
+        db = self.session_factory()
+        try:
+            # Las escrituras en el outbox son cortas: se hacen en el propio loop
+            release_stale_claims(db)
+            self._prune_keys(db)
+            alerts = claim_batch(db, self.batch_size, digest_window_min=self.digest_window_min)
+            if not alerts:
+                return {"claimed": 0, "sent": 0, "failed": 0, "emails": 0}
+            groups = coalesce(alerts, self.digest_window_min)
+            slots = asyncio.Semaphore(self.concurrency)
+            outcomes = await asyncio.gather(*(self._deliver(slots, group) for group in groups))
+            results = [(alert, error, retry) for group, (error, retry) in zip(groups, outcomes) for alert in group]
+            record_results(db, results)
+            failed = sum(1 for _, error, retry in results if error is not None and retry)
+            return {"claimed": len(alerts), "sent": len(alerts) - failed, "failed": failed, "emails": len(groups)}
+        finally:
+            db.close()
+
+    async def adrain(self) -> dict:
+        """Procesa lotes hasta que no queden alertas vencidas."""
+        total = {"claimed": 0, "sent": 0, "failed": 0, "emails": 0}
+        while True:
+            stats = await self.arun_once()
+            for k in total:
+                total[k] += stats[k]
+            if stats["claimed"] < self.batch_size:
+                return total
+
+    async def arun_forever(self):
+        print(f"📮 Alert dispatcher started (batch {self.batch_size}, concurrency {self.concurrency})")
+        while True:
+            try:
+                stats = await self.arun_once()
+            except Exception as e:
+                # P.ej. "database is locked" compitiendo con la web: el dispatcher no debe morir.
+                # Las alertas ya reclamadas vuelven a PENDING al caducar su lease (release_stale_claims)
+                print(f"❌ Alert dispatcher iteration failed: {type(e).__name__}: {e}")
+                await asyncio.sleep(self.poll_interval)
+                continue
+            if stats["claimed"]:
+                print(f"📮 Alerts: {stats}")
+            # Lote lleno: probablemente hay más pendientes, seguir sin esperar
+            if stats["claimed"] < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    def run_once(self) -> dict:
+        return asyncio.run(self.arun_once())
+
+    def drain(self) -> dict:
+        return asyncio.run(self.adrain())
+
+    def run_forever(self):
+        asyncio.run(self.arun_forever())
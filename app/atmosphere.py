@@ -0,0 +1,133 @@
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import func, desc, case
+from sqlalchemy.orm import Session
+from .models import ClassObservation, TeacherAtmosphere
+from .utils.text_analysis import calculate_atmosphere_score
+
+# Nº de observaciones recientes que definen el ambiente de clase de un profesor
+ATMOSPHERE_WINDOW = 5
+
+
+def _recent_observations(db: Session, teacher_id: int):
+    return db.query(ClassObservation.id, ClassObservation.row_risk, ClassObservation.content)\
+        .filter(ClassObservation.teacher_id == teacher_id)\
+        .order_by(ClassObservation.timestamp.desc())\
+        .limit(ATMOSPHERE_WINDOW).all()
+
+
+def refresh_teacher_atmosphere(db: Session, teacher_id: int) -> float:
+    """
+    Recalcula y guarda la puntuación de un profesor. Se llama al escribir una observación,
+    en la misma transacción (el commit lo hace el llamador).
+    """
+    observations = _recent_observations(db, teacher_id)
+    score = calculate_atmosphere_score(observations)
+    db.merge(TeacherAtmosphere(
+        teacher_id=teacher_id,
+        score=score,
+        observation_count=len(observations),
+        last_observation_id=max((o.id for o in observations), default=None),
+        updated_at=datetime.utcnow()
+    ))
+    return score
+
+
+def get_teacher_atmosphere(db: Session, teacher_id: int) -> float:
+    """
+    Puntuación de ambiente de un profesor: lectura por clave primaria.
+    Si aún no está materializada (observaciones anteriores a la tabla) se calcula sin guardarla,
+    para no competir por la misma fila con otros envíos concurrentes.
+    """
+    row = db.get(TeacherAtmosphere, teacher_id)
+    if row is not None:
+        return row.score
+    return calculate_atmosphere_score(_recent_observations(db, teacher_id))
+
+
+def compute_teacher_sentiments_bulk(db: Session, teacher_ids=None) -> dict:
+    """
+    Returns {teacher_id: atmosphere_score} calculado desde las observaciones, en una sola query
+    (window function). Se usa para los profesores sin fila materializada y para reconstruir la tabla.
+    """
+    # row_number() over (partition by teacher_id order by timestamp desc)
+    subquery = db.query(
+        ClassObservation.id,
+        ClassObservation.teacher_id,
+        ClassObservation.row_risk,
+        # El texto solo hace falta en filas antiguas sin row_risk precalculado
+        case((ClassObservation.row_risk.is_(None), ClassObservation.content), else_=None).label("content"),
+        func.row_number().over(
+            partition_by=ClassObservation.teacher_id,
+            order_by=desc(ClassObservation.timestamp)
+        ).label("rn")
+    )
+    if teacher_ids is not None:
+        subquery = subquery.filter(ClassObservation.teacher_id.in_(teacher_ids))
+    subquery = subquery.subquery()
+
+    results = db.query(
+        subquery.c.id,
+        subquery.c.teacher_id,
+        subquery.c.row_risk,
+        subquery.c.content
+    ).filter(
+        subquery.c.rn <= ATMOSPHERE_WINDOW
+    ).all()
+
+    observations_by_teacher = defaultdict(list)
+    for row in results:
+        observations_by_teacher[row.teacher_id].append(row)
+
+    return {
+        teacher_id: calculate_atmosphere_score(observations)
+        for teacher_id, observations in observations_by_teacher.items()
+    }
+
+
+def get_teacher_sentiments_bulk(db: Session, teacher_ids=None) -> dict:
+    """
+    Returns {teacher_id: atmosphere_score}: lee la tabla materializada y solo calcula
+    desde las observaciones a los profesores que aún no tienen fila.
+    """
+    query = db.query(TeacherAtmosphere.teacher_id, TeacherAtmosphere.score)
+    if teacher_ids is not None:
+        query = query.filter(TeacherAtmosphere.teacher_id.in_(teacher_ids))
+    sentiments = {row.teacher_id: row.score for row in query.all()}
+
+    missing = db.query(ClassObservation.teacher_id).distinct()\
+        .outerjoin(TeacherAtmosphere, TeacherAtmosphere.teacher_id == ClassObservation.teacher_id)\
+        .filter(TeacherAtmosphere.teacher_id.is_(None), ClassObservation.teacher_id.isnot(None))
+    if teacher_ids is not None:
+        missing = missing.filter(ClassObservation.teacher_id.in_(teacher_ids))
+    missing = [row.teacher_id for row in missing.all()]
+    if missing:
+        sentiments.update(compute_teacher_sentiments_bulk(db, missing))
+    return sentiments
+
+
+def rebuild_teacher_atmosphere(db: Session) -> int:
+    """Reconstruye toda la tabla teacher_atmosphere desde las observaciones. Returns nº de profesores."""
+    scores = compute_teacher_sentiments_bulk(db)
+    counts = dict(
+        db.query(ClassObservation.teacher_id, func.count(ClassObservation.id))
+        .group_by(ClassObservation.teacher_id).all()
+    )
+    last_ids = dict(
+        db.query(ClassObservation.teacher_id, func.max(ClassObservation.id))
+        .group_by(ClassObservation.teacher_id).all()
+    )
+    now = datetime.utcnow()
+    db.query(TeacherAtmosphere).delete()
+    db.add_all([
+        TeacherAtmosphere(
+            teacher_id=teacher_id,
+            score=score,
+            observation_count=min(counts.get(teacher_id, 0), ATMOSPHERE_WINDOW),
+            last_observation_id=last_ids.get(teacher_id),
+            updated_at=now
+        )
+        for teacher_id, score in scores.items() if teacher_id is not None
+    ])
+    db.commit()
+    return len(scores)
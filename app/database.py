@@ -1,5 +1,8 @@
+import asyncio
+import contextlib
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from .models import Base
 
 # Usamos SQLite localmente, luego cambiaremos a PostgreSQL en la nube
@@ -10,6 +13,19 @@ engine = create_engine(
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Motor async (aiosqlite) para los endpoints de alto volumen: no bloquean el event loop
+# mientras esperan a la BD. Misma base de datos que el motor sync.
+ASYNC_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL)
+# expire_on_commit=False: los objetos siguen usables tras el commit sin volver a la BD
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# SQLite admite un solo escritor: con varias conexiones escribiendo a la vez, las que pierden
+# esperan en el busy handler con backoff (colas de latencia de segundos). Serializar las
+# escrituras del proceso con un lock async evita esa espera. En otras BDs no hace nada.
+async_write_lock = asyncio.Lock() if ASYNC_DATABASE_URL.startswith("sqlite") else contextlib.nullcontext()
+
 def init_db():
     Base.metadata.create_all(bind=engine)
 
@@ -19,3 +35,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
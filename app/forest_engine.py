@@ -0,0 +1,123 @@
+import numpy as np
+
+
+class CompiledForest:
+    """
+    RandomForestClassifier aplanado en arrays NumPy contiguos (feature, threshold, hijos, valor de nodo)
+    para evaluar filas sin la sobrecarga de sklearn (validación de entrada, joblib por estimador).
+
+    Todos los árboles comparten los mismos arrays; los nodos hoja apuntan a sí mismos, así
+    el recorrido es un número fijo de pasos (max_depth) vectorizado sobre (filas x árboles).
+    """
+
+    # Filas por bloque: acota la matriz (filas x árboles) de nodos en lotes grandes
+    BLOCK_ROWS = 256
+
+    def __init__(self, feature, threshold, left, right, node_value, roots, max_depth, n_features):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.node_value = node_value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.n_features = n_features
+
+    @classmethod
+    def from_sklearn(cls, clf, positive_class=1):
+        classes = list(clf.classes_)
+        if len(classes) < 2:
+            raise ValueError("CompiledForest needs a model trained with at least two classes")
+        class_idx = classes.index(positive_class) if positive_class in classes else len(classes) - 1
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in clf.estimators_:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            node_ids = np.arange(n_nodes, dtype=np.int64)
+            is_leaf = tree.children_left == -1
+
+            # Hojas: se apuntan a sí mismas y usan la feature 0 (cualquiera vale)
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.int64))
+            thresholds.append(tree.threshold.astype(np.float64))
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+
+            # value puede ser conteos o fracciones según la versión de sklearn -> normalizar
+            value = tree.value[:, 0, :]
+            totals = value.sum(axis=1)
+            totals[totals == 0] = 1.0
+            values.append(value[:, class_idx] / totals)
+
+            roots.append(offset)
+            offset += n_nodes
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            feature=np.ascontiguousarray(np.concatenate(features)),
+            threshold=np.ascontiguousarray(np.concatenate(thresholds)),
+            left=np.ascontiguousarray(np.concatenate(lefts)),
+            right=np.ascontiguousarray(np.concatenate(rights)),
+            node_value=np.ascontiguousarray(np.concatenate(values)),
+            roots=np.asarray(roots, dtype=np.int64),
+            max_depth=max_depth,
+            n_features=clf.n_features_in_,
+        )
+
+    def predict_proba(self, X):
+        """Probabilidad de la clase positiva para cada fila de X (N, n_features)."""
+        # sklearn compara en float32 contra umbrales float64: replicarlo da paridad exacta
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"Expected {self.n_features} features, got {X.shape[1]}")
+
+        out = np.empty(len(X), dtype=np.float64)
+        for start in range(0, len(X), self.BLOCK_ROWS):
+            block = X[start:start + self.BLOCK_ROWS]
+            out[start:start + len(block)] = self._evaluate(block)
+        return out
+
+    def contributions(self, X):
+        """
+        Aproximación rápida a SHAP (método de caminos / Saabas): cada split del camino de decisión
+        atribuye a su feature el cambio de probabilidad entre el nodo y el hijo elegido.
+        Returns (N, n_features), promediado sobre los árboles.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+
+        out = np.empty((len(X), self.n_features), dtype=np.float64)
+        for start in range(0, len(X), self.BLOCK_ROWS):
+            block = X[start:start + self.BLOCK_ROWS]
+            out[start:start + len(block)] = self._contributions(block)
+        return out
+
+    def _contributions(self, X):
+        n_rows, n_trees = len(X), len(self.roots)
+        rows = np.arange(n_rows)[:, None]
+        # Índice plano fila * n_features + feature para acumular con un solo bincount por paso
+        row_offsets = rows * self.n_features
+        totals = np.zeros(n_rows * self.n_features, dtype=np.float64)
+        nodes = np.broadcast_to(self.roots, (n_rows, n_trees)).copy()
+        for _ in range(self.max_depth):
+            features = self.feature[nodes]
+            go_left = X[rows, features] <= self.threshold[nodes]
+            children = np.where(go_left, self.left[nodes], self.right[nodes])
+            # En hojas child == node -> delta 0
+            delta = self.node_value[children] - self.node_value[nodes]
+            totals += np.bincount((row_offsets + features).ravel(), weights=delta.ravel(), minlength=totals.size)
+            nodes = children
+        return totals.reshape(n_rows, self.n_features) / n_trees
+
+    def _evaluate(self, X):
+        rows = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return self.node_value[nodes].mean(axis=1)
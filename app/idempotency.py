@@ -0,0 +1,93 @@
+import os
+import json
+import hashlib
+from datetime import datetime, timedelta
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import select, delete
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from .models import SubmissionKey
+from .database import async_write_lock
+from .utils.cache import LRUCache
+
+# Cabecera que envían los clientes (app móvil) para que un reintento no duplique el envío
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 128
+# Una clave protege los reintentos durante este tiempo; después se ignora y se borra
+# (cada una guarda la respuesta completa, hasta un BulkSubmitResult de 2000 filas)
+IDEMPOTENCY_TTL_H = float(os.getenv("IDEMPOTENCY_TTL_H", "24"))
+
+# Claves recientes en memoria: la mayoría de reintentos llegan segundos después al mismo worker
+# y se responden sin tocar la BD. La tabla submission_keys es la fuente de verdad entre workers.
+IDEMPOTENCY_CACHE_SIZE = 10000
+_recent_keys = LRUCache(IDEMPOTENCY_CACHE_SIZE)
+
+
+def validate_key(key: Optional[str]) -> Optional[str]:
+    if key is None:
+        return None
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"{IDEMPOTENCY_HEADER} must be 1-{MAX_KEY_LENGTH} characters")
+    return key
+
+
+def request_fingerprint(payload) -> str:
+    """sha256 del cuerpo normalizado (JSON con claves ordenadas)."""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _cutoff(now: datetime = None) -> datetime:
+    return (now or datetime.utcnow()) - timedelta(hours=IDEMPOTENCY_TTL_H)
+
+
+def _check(request_hash: str, stored_hash: str, response: str) -> str:
+    if stored_hash != request_hash:
+        raise HTTPException(status_code=409, detail=f"{IDEMPOTENCY_HEADER} already used with a different request")
+    return response
+
+
+async def find_replay(db: AsyncSession, user_id: int, key: str, request_hash: str,
+                      purge_expired: bool = True) -> Optional[str]:
+    """
+    JSON de la respuesta original si (usuario, clave) ya se procesó; None si es un envío nuevo.
+    409 si la clave se usó con otro contenido. Una clave de hace más de IDEMPOTENCY_TTL_H cuenta
+    como nueva: con purge_expired se borra ya (con el lock de escritura), para que este envío pueda
+    guardarla otra vez sin chocar con el índice único.
+    """
+    cutoff = _cutoff()
+    cached = _recent_keys.get((user_id, key))
+    if cached is not None and cached[2] >= cutoff:
+        return _check(request_hash, cached[0], cached[1])
+
+    row = (await db.execute(
+        select(SubmissionKey.request_hash, SubmissionKey.response, SubmissionKey.created_at)
+        .where(SubmissionKey.user_id == user_id, SubmissionKey.key == key)
+    )).first()
+    if row is None:
+        return None
+    if row.created_at < cutoff:
+        if purge_expired:
+            async with async_write_lock:
+                await db.execute(delete(SubmissionKey).where(
+                    SubmissionKey.user_id == user_id, SubmissionKey.key == key, SubmissionKey.created_at < cutoff
+                ))
+                await db.commit()
+        return None
+    _recent_keys.put((user_id, key), (row.request_hash, row.response, row.created_at))
+    return _check(request_hash, row.request_hash, row.response)
+
+
+def remember(user_id: int, key: str, request_hash: str, response: str):
+    """Tras el commit: los siguientes reintentos se responden desde memoria."""
+    _recent_keys.put((user_id, key), (request_hash, response, datetime.utcnow()))
+
+
+def prune_submission_keys(db: Session, now: datetime = None) -> int:
+    """Borra las claves caducadas (y sus respuestas guardadas). Lo ejecuta el dispatcher periódicamente."""
+    result = db.execute(
+        delete(SubmissionKey).where(SubmissionKey.created_at < _cutoff(now)).execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
@@ -1,157 +1,538 @@
+import io
+import os
 import json
+import time
+import hashlib
+import threading
 import joblib
+import numpy as np
 import pandas as pd
 import shap
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
-from .models import SurveyResponse, AlertLevel, ClassObservation, User, Student
+from sklearn.metrics import roc_auc_score
+from .models import SurveyResponse, AlertLevel, User, Student
 from .database import engine
-from .utils.text_analysis import calculate_atmosphere_score
+from .model_registry import ModelRegistry, model_registry
+from .forest_engine import CompiledForest
+from .utils.cache import LRUCache
+from .agents.rules import rule_plan
+from .atmosphere import get_teacher_sentiments_bulk
+from .utils.text_analysis import score_text_risk
 
 MODEL_PATH = "model.pkl"
 
-def load_data(db: Session):
-    surveys = db.query(SurveyResponse).filter(SurveyResponse.raw_answers.isnot(None)).all()
-    data = []
-    
-    for s in surveys:
+# Orden de columnas del vector de features (igual que en load_data).
+# Las features nuevas se añaden al final: los modelos antiguos usan las primeras n_features_in_.
+ITEM_COLUMNS = [f'p_item_{i}' for i in range(1, 14)]
+FEATURE_COLUMNS = ITEM_COLUMNS + ['teacher_sentiment', 'text_risk']
+# Campo de texto libre del que sale text_risk (utils/text_analysis.score_text_risk)
+TEXT_RISK_FIELD = "p_observations"
+
+# Motor de inferencia: "auto" (bosque compilado en NumPy para lotes pequeños, sklearn para grandes),
+# "compiled" o "sklearn". Ver forest_engine.CompiledForest.
+INFERENCE_ENGINE = os.getenv("ML_INFERENCE_ENGINE", "auto").lower()
+# Por encima de este tamaño de lote el predict_proba de sklearn (Cython) es más rápido
+COMPILED_MAX_ROWS = 64
+
+# Modo de explicación por defecto: "exact", "cached" (mismo resultado que exact) o "fast". Ver EXPLANATION_MODES.
+EXPLANATION_MODE = os.getenv("ML_EXPLANATION_MODE", "cached").lower()
+EXPLANATION_CACHE_SIZE = 4096
+
+# Memo de predicciones completas (probabilidad + explicación) por vector de features.
+# 0 lo desactiva. Sentimiento y text_risk se redondean a SENTIMENT_DECIMALS para que vectores casi iguales compartan entrada.
+PREDICTION_CACHE_SIZE = int(os.getenv("ML_PREDICTION_CACHE_SIZE", "8192"))
+SENTIMENT_DECIMALS = 2
+
+
+class ModelHolder:
+    """
+    Mantiene el modelo entrenado residente en memoria (se deserializa una vez por versión).
+    Sigue el puntero ACTIVE del registro de modelos (o model.pkl si el registro está vacío)
+    y hace hot-swap atómico cuando train_model registra uno nuevo o se hace rollback.
+    """
+
+    # Segundos entre comprobaciones del fichero (un stat() por intervalo, no por predicción)
+    CHECK_INTERVAL = 2.0
+
+    def __init__(self, path: str = MODEL_PATH, registry: ModelRegistry = None):
+        self.path = path # Fallback legacy si no hay versión activa en el registro
+        self.registry = registry
+        self.source = None
+        self._lock = threading.Lock()
+        # (model, version) se sustituye como una sola referencia -> lectores nunca ven estados mezclados
+        self._state = (None, None)
+        # name -> (version, obj) - ver derived()
+        self._derived_lock = threading.Lock()
+        self._derived_cache = {}
+        self.build_times = {}
+        self._signature = None
+        self._last_check = 0.0
+        self.load_time = 0.0
+        self.loaded_at = None
+        self.swap_count = 0
+
+    @property
+    def version(self):
+        return self._state[1]
+
+    def current(self):
+        """Devuelve (model, version) de forma consistente."""
+        self.get()
+        return self._state
+
+    def derived(self, name, model, version, builder):
+        """
+        Objeto derivado del modelo (explainer, bosque compilado...) construido una sola vez
+        por versión y reutilizado hasta el siguiente hot-swap.
+        """
+        cached_version, obj = self._derived_cache.get(name, (None, None))
+        if cached_version == version and obj is not None:
+            return obj
+
+        with self._derived_lock:
+            cached_version, obj = self._derived_cache.get(name, (None, None))
+            if cached_version == version and obj is not None:
+                return obj
+            start = time.perf_counter()
+            obj = builder(model)
+            self.build_times[name] = time.perf_counter() - start
+            self._derived_cache[name] = (version, obj)
+            return obj
+
+    def get_explainer(self, model, version):
+        # Recorrer los 100 árboles es lo más caro de puntuar una encuesta, así que se reutiliza
+        return self.derived("explainer", model, version, shap.TreeExplainer)
+
+    def get_compiled(self, model, version):
+        return self.derived("compiled_forest", model, version, CompiledForest.from_sklearn)
+
+    def get(self):
+        """Devuelve el modelo actual (o None si no hay modelo entrenado)."""
+        now = time.monotonic()
+        if self._state[0] is None or now - self._last_check >= self.CHECK_INTERVAL:
+            self._last_check = now
+            self._check_file()
+        return self._state[0]
+
+    def refresh(self):
+        """Fuerza la comprobación del fichero (p.ej. justo después de train_model)."""
+        self._last_check = time.monotonic()
+        self._check_file()
+        return self._state[0]
+
+    def _check_file(self):
+        active = self.registry.active_version() if self.registry is not None else None
+        if active:
+            # Los artefactos del registro son inmutables: basta con comparar la versión
+            signature = ("registry", active)
+            path = self.registry.artifact_path(active)
+        else:
+            path = self.path
+            try:
+                st = os.stat(path)
+            except OSError:
+                # Sin fichero: mantenemos el modelo que ya estuviera cargado
+                return
+            signature = (st.st_mtime_ns, st.st_size)
+        if signature == self._signature:
+            return
+
+        with self._lock:
+            if signature == self._signature:
+                return # Otro hilo ya lo ha recargado
+            self._load(path, signature, version=active)
+
+    def _load(self, path, signature, version=None):
+        start = time.perf_counter()
         try:
-            answers = json.loads(s.raw_answers)
-            # Flatten features
-            row = {}
-            # Items 1-13
-            for i in range(1, 14):
-                row[f'p_item_{i}'] = int(answers.get(f'p_item_{i}', 0))
-                
-            # --- NEW: Teacher Context ---
-            # Find the teacher associated with the student AT THE TIME
-            # (Simplification: Use current teacher observations)
-            teacher_sentiment = 0.0
-            if s.student and s.student.teacher_id:
-                # Get observations from THAT teacher
-                # Ideal: Filter by date range near survey. Simplification: Last 5.
-                observations = db.query(ClassObservation)\
-                    .filter(ClassObservation.teacher_id == s.student.teacher_id)\
-                    .order_by(ClassObservation.timestamp.desc())\
-                    .limit(5).all()
-                    
-                teacher_sentiment = calculate_atmosphere_score(observations)
-            
-            row['teacher_sentiment'] = teacher_sentiment
-            # ----------------------------
-            
-            # Target Determination
-            # 1. Expert Label Overrides everything
-            if s.expert_label == "real_case":
-                target = 1
-            elif s.expert_label == "false_positive":
-                target = 0
-            elif s.expert_label == "false_negative":
-                target = 1 
-            else:
-                # 2. Heuristic fallback
-                if s.risk_level in [AlertLevel.HIGH, AlertLevel.CRITICAL]:
-                    target = 1
-                else:
-                    target = 0
-            
-            row['target'] = target
-            data.append(row)
-        except:
-            continue
-            
-    return pd.DataFrame(data)
-
-def train_model():
+            with open(path, "rb") as f:
+                payload = f.read()
+            if version is None:
+                version = hashlib.sha256(payload).hexdigest()[:12]
+            if version == self._state[1]:
+                # Mismo contenido (touch / copia): no hace falta deserializar
+                self._signature = signature
+                return
+            model = joblib.load(io.BytesIO(payload))
+        except Exception as e:
+            print(f"ML Error: could not load {path}: {e}")
+            return
+
+        is_swap = self._state[0] is not None
+        self._state = (model, version)
+        self._signature = signature
+        self.source = path
+        self.load_time = time.perf_counter() - start
+        self.loaded_at = time.time()
+        if is_swap:
+            self.swap_count += 1
+        print(f"Model {version} loaded from {path} in {self.load_time * 1000:.1f} ms")
+
+    def stats(self) -> dict:
+        return {
+            "path": self.source or self.path,
+            "loaded": self._state[0] is not None,
+            "version": self.version,
+            "load_time_ms": round(self.load_time * 1000, 2),
+            "loaded_at": self.loaded_at,
+            "swap_count": self.swap_count,
+            "inference_engine": INFERENCE_ENGINE,
+            "explanation_mode": EXPLANATION_MODE,
+            "derived": {
+                name: dict(
+                    {"version": version, "build_time_ms": round(self.build_times.get(name, 0.0) * 1000, 2)},
+                    **(obj.stats() if hasattr(obj, "stats") else {})
+                )
+                for name, (version, obj) in self._derived_cache.items()
+            },
+        }
+
+model_holder = ModelHolder(registry=model_registry)
+
+
+def _target_from_labels(expert_label, risk_level):
+    # Target Determination
+    # 1. Expert Label Overrides everything
+    if expert_label == "real_case":
+        return 1
+    elif expert_label == "false_positive":
+        return 0
+    elif expert_label == "false_negative":
+        return 1 
+    # 2. Heuristic fallback
+    if risk_level in [AlertLevel.HIGH, AlertLevel.CRITICAL]:
+        return 1
+    return 0
+
+# Filas por página al recorrer survey_responses (keyset pagination sobre id)
+EXTRACT_CHUNK_SIZE = 5000
+
+def iter_training_chunks(db: Session, chunk_size: int = EXTRACT_CHUNK_SIZE):
+    """
+    Recorre survey_responses por páginas (WHERE id > último ORDER BY id LIMIT n) y
+    devuelve las filas de cada página. Nunca se materializa la tabla completa.
+    """
+    last_id = 0
+    while True:
+        # Solo columnas, sin objetos ORM ni lazy loads
+        rows = db.query(
+            SurveyResponse.id,
+            SurveyResponse.raw_answers,
+            SurveyResponse.expert_label,
+            SurveyResponse.risk_level,
+            Student.teacher_id
+        ).outerjoin(Student, SurveyResponse.student_id == Student.id)\
+            .filter(SurveyResponse.raw_answers.isnot(None), SurveyResponse.id > last_id)\
+            .order_by(SurveyResponse.id)\
+            .limit(chunk_size).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+def extract_training_set(db: Session, chunk_size: int = EXTRACT_CHUNK_SIZE, progress=None):
+    """
+    Returns (X, y): X float32 (N, len(FEATURE_COLUMNS)) en el orden de FEATURE_COLUMNS, y int8 (N,).
+    Los arrays se reservan una vez con el COUNT de la tabla y se rellenan página a página,
+    así la memoria depende solo del tamaño final de la matriz.
+    progress(stage, fraction) se llama tras cada página.
+    """
+    start = time.perf_counter()
+    total = db.query(func.count(SurveyResponse.id))\
+        .filter(SurveyResponse.raw_answers.isnot(None)).scalar() or 0
+
+    X = np.zeros((total, len(FEATURE_COLUMNS)), dtype=np.float32)
+    y = np.zeros(total, dtype=np.int8)
+    if total == 0:
+        return X, y
+
+    # --- Teacher Context ---
+    # Find the teacher associated with the student AT THE TIME
+    # (Simplification: Use current teacher observations, last 5)
+    teacher_sentiments = get_teacher_sentiments_bulk(db)
+
+    n = 0
+    for rows in iter_training_chunks(db, chunk_size):
+        for s in rows:
+            if n >= total:
+                break # Filas insertadas después del COUNT: se quedan para el próximo entrenamiento
+            try:
+                answers = json.loads(s.raw_answers)
+                # Flatten features: Items 1-13
+                X[n, :13] = [int(answers.get(col, 0)) for col in ITEM_COLUMNS]
+            except:
+                continue
+            X[n, 13] = teacher_sentiments.get(s.teacher_id, 0.0) if s.teacher_id else 0.0
+            X[n, 14] = round(score_text_risk(answers.get(TEXT_RISK_FIELD)), SENTIMENT_DECIMALS)
+            y[n] = _target_from_labels(s.expert_label, s.risk_level)
+            n += 1
+        if progress:
+            progress("extracting", min(n / total, 1.0))
+
+    elapsed = time.perf_counter() - start
+    rate = n / elapsed if elapsed > 0 else float(n)
+    print(f"Extracted {n} training rows in {elapsed:.2f}s ({rate:.0f} rows/s)")
+
+    # Filas descartadas (JSON inválido) -> recortar sin copiar
+    return X[:n], y[:n]
+
+def load_data(db: Session):
+    X, y = extract_training_set(db)
+    df = pd.DataFrame(X, columns=FEATURE_COLUMNS)
+    df['target'] = y
+    return df
+
+def _benchmark_inference(clf, X, runs: int = 20) -> dict:
+    """Latencia de inferencia (ms) para una fila y por fila en lote, para comparar versiones."""
+    rows = X[:min(len(X), 1000)]
+    single = pd.DataFrame(rows[:1], columns=FEATURE_COLUMNS)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        clf.predict_proba(single)
+        timings.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    clf.predict_proba(pd.DataFrame(rows, columns=FEATURE_COLUMNS))
+    batch_time = time.perf_counter() - start
+    benchmark = {
+        "single_row_ms_p50": round(float(np.median(timings)) * 1000, 3),
+        "batch_ms_per_row": round(batch_time * 1000 / len(rows), 4),
+        "batch_rows": len(rows),
+    }
+    if len(clf.classes_) > 1:
+        compiled = CompiledForest.from_sklearn(clf)
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            compiled.predict_proba(rows[:1])
+            timings.append(time.perf_counter() - start)
+        benchmark["compiled_single_row_ms_p50"] = round(float(np.median(timings)) * 1000, 3)
+    return benchmark
+
+def _oob_metrics(clf, y) -> dict:
+    # Métricas out-of-bag: sin holdout, todos los datos siguen entrando en el entrenamiento
+    metrics = {"positive_rate": round(float(np.mean(y)), 4)}
+    if getattr(clf, "oob_score_", None) is not None:
+        metrics["oob_accuracy"] = round(float(clf.oob_score_), 4)
+        decision = getattr(clf, "oob_decision_function_", None)
+        if decision is not None and len(clf.classes_) > 1 and not np.isnan(decision).any():
+            metrics["oob_roc_auc"] = round(float(roc_auc_score(y, decision[:, 1])), 4)
+    return metrics
+
+def train_model(n_jobs=None, progress=None, activate=True):
+    """
+    Entrena el RandomForest y lo publica como nueva versión en el registro de modelos.
+    n_jobs=-1 usa todos los cores (lo hace el job de reentrenamiento en segundo plano).
+    Returns la versión registrada, o False si no hay datos.
+    """
     with Session(engine) as db:
-        df = load_data(db)
+        X, y = extract_training_set(db, progress=progress)
     
-    if df.empty:
+    if len(X) == 0:
         print("No data to train.")
         return False
-
-    X = df.drop(columns=['target'])
-    y = df['target']
     
-    clf = RandomForestClassifier(n_estimators=100, random_state=42)
-    clf.fit(X, y)
+    if progress:
+        progress("fitting", 0.0)
+    start = time.perf_counter()
+    clf = RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=n_jobs, oob_score=True)
+    # DataFrame sobre la matriz (sin copia) para conservar los nombres de feature
+    clf.fit(pd.DataFrame(X, columns=FEATURE_COLUMNS, copy=False), y)
+    training_time = time.perf_counter() - start
+    # Para inferencia de pocas filas el reparto entre procesos cuesta más que recorrer los árboles
+    clf.set_params(n_jobs=None)
     
-    joblib.dump(clf, MODEL_PATH)
-    print(f"Model trained on {len(df)} samples.")
-    return True
+    if progress:
+        progress("saving", 0.0)
+    version = model_registry.register(clf, {
+        "training_rows": len(X),
+        "features": FEATURE_COLUMNS,
+        "n_estimators": clf.n_estimators,
+        "training_time_s": round(training_time, 3),
+        "metrics": _oob_metrics(clf, y),
+        "inference_benchmark": _benchmark_inference(clf, X),
+    }, activate=activate)
+    model_holder.refresh()
+    print(f"Model {version} trained on {len(X)} samples.")
+    return version
 
-def predict_risk(answers_dict, teacher_sentiment=0.0):
+def build_feature_matrix(answers_list, teacher_sentiments=None):
     """
-    Returns (probability, explanation_text)
+    Construye la matriz (N, len(FEATURE_COLUMNS)) de features en NumPy, sin un DataFrame por fila.
     """
-    try:
-        clf = joblib.load(MODEL_PATH)
-    except:
-        return 0.0, "Model not trained yet."
-    
-    # Prepare features
-    features = {}
-    for i in range(1, 14):
-        features[f'p_item_{i}'] = [int(answers_dict.get(f'p_item_{i}', 0))]
-        
-    # Add new feature
-    features['teacher_sentiment'] = [teacher_sentiment]
-    
-    X_new = pd.DataFrame(features)
-    
+    n = len(answers_list)
+    X = np.zeros((n, len(FEATURE_COLUMNS)), dtype=np.float64)
+    for row, answers in enumerate(answers_list):
+        X[row, :13] = [int(answers.get(col, 0)) for col in ITEM_COLUMNS]
+        # Riesgo del texto libre (cacheado por hash del texto)
+        X[row, 14] = round(score_text_risk(answers.get(TEXT_RISK_FIELD)), SENTIMENT_DECIMALS)
+    if teacher_sentiments is not None:
+        # Sentimiento cuantizado: acota el espacio de entradas (y las claves del memo de predicciones)
+        X[:, 13] = np.round(np.asarray(teacher_sentiments, dtype=np.float64), SENTIMENT_DECIMALS)
+    return X
+
+def _model_view(clf, X):
+    """Columnas que conoce el modelo: los entrenados antes de añadir una feature usan un prefijo."""
+    n_features = getattr(clf, "n_features_in_", X.shape[1])
+    return X if n_features == X.shape[1] else X[:, :n_features]
+
+def _use_compiled(n_rows):
+    if INFERENCE_ENGINE == "compiled":
+        return True
+    return INFERENCE_ENGINE == "auto" and n_rows <= COMPILED_MAX_ROWS
+
+def _predict_proba(clf, version, X):
     # Predict Proba Robustness
     if hasattr(clf, "classes_") and len(clf.classes_) > 1:
-        prob = clf.predict_proba(X_new)[0][1] # Probability of Class 1
-    else:
-        # If model only knows one class
-        if hasattr(clf, "classes_") and clf.classes_[0] == 1:
-            prob = 1.0
+        if _use_compiled(len(X)):
+            return model_holder.get_compiled(clf, version).predict_proba(X)
+        # Un único DataFrame para todo el lote (el modelo se entrenó con nombres de columna)
+        return clf.predict_proba(pd.DataFrame(X, columns=FEATURE_COLUMNS[:X.shape[1]]))[:, 1] # Probability of Class 1
+    # If model only knows one class
+    if hasattr(clf, "classes_") and clf.classes_[0] == 1:
+        return np.ones(len(X))
+    return np.zeros(len(X))
+
+def _apply_safety_nets(X, probs):
+    """Returns (probs, explanation_prefixes)"""
+    # SAFETY NETS (Reglas de Oro): definidas en agents/risk_rules.json (ml_safety_nets)
+    return rule_plan.apply_safety_nets(X, probs, FEATURE_COLUMNS)
+
+def _class1_shap_values(shap_values, n_rows, n_features):
+    # SHAP Robustness: Handle different return shapes
+    # Binary classification: [array_class_0, array_class_1], (N, features, classes) or (N, features) depending on version
+    if isinstance(shap_values, list) and len(shap_values) > 1:
+        return np.asarray(shap_values[1]) # Class 1
+    if isinstance(shap_values, list) and len(shap_values) == 1:
+        # Only one class explained?
+        return np.asarray(shap_values[0])
+    if hasattr(shap_values, 'shape') and len(shap_values.shape) == 3:
+        return shap_values[:, :, -1] # Última clase = Class 1 (o la única conocida)
+    if hasattr(shap_values, 'shape') and len(shap_values.shape) == 2:
+        return shap_values # (N, features)
+    # Fallback
+    return np.zeros((n_rows, n_features))
+
+def _shap_values(clf, version, X):
+    explainer = model_holder.get_explainer(clf, version)
+    return _class1_shap_values(explainer.shap_values(X), len(X), X.shape[1])
+
+def _cached_shap_values(clf, version, X):
+    # Las respuestas son 13 items en 0..4: muchos vectores se repiten -> memo por vector exacto.
+    # La caché es un objeto derivado del modelo: un hot-swap la invalida automáticamente.
+    memo = model_holder.derived("shap_memo", clf, version, lambda _: LRUCache(EXPLANATION_CACHE_SIZE))
+    keys = [row.tobytes() for row in X]
+    vals = np.empty(X.shape, dtype=np.float64)
+    missing = []
+    for row, key in enumerate(keys):
+        cached = memo.get(key)
+        if cached is None:
+            missing.append(row)
         else:
-            prob = 0.0
+            vals[row] = cached
+    if missing:
+        # Una sola llamada SHAP para todas las filas no cacheadas del lote
+        computed = _shap_values(clf, version, X[missing])
+        for row, row_vals in zip(missing, computed):
+            vals[row] = row_vals
+            memo.put(keys[row], row_vals)
+    return vals
+
+def _path_contributions(clf, version, X):
+    if not (hasattr(clf, "classes_") and len(clf.classes_) > 1):
+        return np.zeros(X.shape)
+    return model_holder.get_compiled(clf, version).contributions(X)
+
+# Modos de explicación: SHAP exacto, SHAP memoizado por vector de respuestas,
+# o aproximación rápida por contribuciones de camino sobre el bosque compilado.
+EXPLANATION_MODES = {
+    "exact": _shap_values,
+    "cached": _cached_shap_values,
+    "fast": _path_contributions,
+}
+
+def feature_contributions(clf, version, X, mode=None):
+    """Contribución de cada feature a la probabilidad de riesgo, (N, n_features)."""
+    mode = mode or EXPLANATION_MODE
+    if mode not in EXPLANATION_MODES:
+        raise ValueError(f"Unknown explanation mode: {mode}")
+    return EXPLANATION_MODES[mode](clf, version, X)
+
+def _explain(clf, version, X, prefixes, mode=None):
+    # Explainability - objetos cacheados por versión de modelo, una sola llamada para todo el lote
+    vals = feature_contributions(clf, version, X, mode)
     
-    # SAFETY NETS (Reglas de Oro)
-    # Item 2: Heridas o moratones (Physical violence) -> Force Critical
-    # Item 5: Coacción o amenazas (Threats) -> Force High
+    # Sort by absolute impact
+    top = np.argsort(-np.abs(vals), axis=1, kind="stable")[:, :3]
     
-    explanation_prefix = ""
-    if features['p_item_2'][0] >= 3: # 3 or 4 means Often/Always
-        prob = 1.0
-        explanation_prefix = "[SAFETY NET] Physical violence detected (Item 2). Risk set to Critical. "
-    elif features['p_item_5'][0] >= 3:
-        if prob < 0.8: prob = 0.8 # Ensure at least High risk
-        explanation_prefix = "[SAFETY NET] Severe threats detected (Item 5). Risk elevated. "
+    explanations = []
+    for row in range(len(X)):
+        top_reasons = []
+        for i in top[row]:
+            if vals[row, i] > 0: # Only list things that INCREASED risk
+                top_reasons.append(f"{FEATURE_COLUMNS[i]} ({vals[row, i]:.2f})")
+        explanations.append(prefixes[row] + ("Risk factors: " + ", ".join(top_reasons) if top_reasons else "Low risk factors detected."))
+    return explanations
+
+def predict_risk_batch(answers_list, teacher_sentiments=None, explain=True, explanation_mode=None):
+    """
+    Puntúa N encuestas en una sola llamada (re-scoring de colegios completos).
+    explanation_mode: "exact", "cached" o "fast" (por defecto ML_EXPLANATION_MODE).
+    Returns [(probability, explanation_text), ...] en el mismo orden que answers_list.
+    """
+    if not answers_list:
+        return []
     
-    # Explainability (SHAP)
-    explainer = shap.TreeExplainer(clf)
-    shap_values = explainer.shap_values(X_new)
+    clf, version = model_holder.current()
+    if clf is None:
+        return [(0.0, "Model not trained yet.")] * len(answers_list)
     
-    # SHAP Robustness: Handle different return shapes
-    # Binary classification: [array_class_0, array_class_1] or just array_class_1 depending on version
-    vals = None
-    if isinstance(shap_values, list) and len(shap_values) > 1:
-        vals = shap_values[1][0] # Class 1
-    elif isinstance(shap_values, list) and len(shap_values) == 1:
-         # Only one class explained?
-         vals = shap_values[0][0]
-    else:
-         # Sometimes it returns a single array if binary
-         if hasattr(shap_values, 'shape') and len(shap_values.shape) == 2:
-             vals = shap_values[0] # (1, features)
-         else:
-             # Fallback
-             vals = [0] * len(X_new.columns)
-
-    feature_names = X_new.columns
+    X = _model_view(clf, build_feature_matrix(answers_list, teacher_sentiments))
+    mode = (explanation_mode or EXPLANATION_MODE) if explain else None
     
-    # Sort by absolute impact
-    indices = sorted(range(len(vals)), key=lambda k: abs(vals[k]), reverse=True)
+    # 1. Memo: vectores ya puntuados con esta versión de modelo no tocan el bosque
+    memo = None
+    if PREDICTION_CACHE_SIZE > 0:
+        memo = model_holder.derived("prediction_memo", clf, version, lambda _: LRUCache(PREDICTION_CACHE_SIZE))
+    keys = [(row.tobytes(), mode) for row in X]
+    results = [memo.get(key) for key in keys] if memo is not None else [None] * len(X)
+    missing = [row for row, result in enumerate(results) if result is None]
+    if not missing:
+        return results
     
-    top_reasons = []
-    for i in indices[:3]:
-        if vals[i] > 0: # Only list things that INCREASED risk
-            top_reasons.append(f"{feature_names[i]} ({vals[i]:.2f})")
-            
-    explanation = explanation_prefix + ("Risk factors: " + ", ".join(top_reasons) if top_reasons else "Low risk factors detected.")
+    # 2. Resto del lote en una sola pasada
+    X_missing = X[missing]
+    probs, prefixes = _apply_safety_nets(X_missing, _predict_proba(clf, version, X_missing))
+    
+    if explain:
+        explanations = _explain(clf, version, X_missing, prefixes, mode)
+    else:
+        explanations = [p.strip() for p in prefixes]
+    
+    for row, prob, explanation in zip(missing, probs, explanations):
+        results[row] = (float(prob), explanation)
+        if memo is not None:
+            memo.put(keys[row], results[row])
+    return results
+
+def predict_risk(answers_dict, teacher_sentiment=0.0, explain=True, explanation_mode=None):
+    """
+    Returns (probability, explanation_text)
+    Con explain=False se omite SHAP y solo se devuelve el prefijo de las reglas de oro
+    (usar explain_risk() más tarde si hace falta el detalle).
+    """
+    return predict_risk_batch([answers_dict], [teacher_sentiment], explain=explain, explanation_mode=explanation_mode)[0]
+
+def explain_risk(answers_dict, teacher_sentiment=0.0, explanation_mode=None):
+    """
+    Explicación diferida: genera solo el texto SHAP (p.ej. al abrir el detalle del caso).
+    """
+    clf, version = model_holder.current()
+    if clf is None:
+        return "Model not trained yet."
     
-    return prob, explanation
+    X = _model_view(clf, build_feature_matrix([answers_dict], [teacher_sentiment]))
+    _, prefixes = _apply_safety_nets(X, np.zeros(1))
+    return _explain(clf, version, X, prefixes, explanation_mode)[0]
@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+import joblib
+from .utils.files import atomic_write_json
+
+MODEL_REGISTRY_DIR = "model_registry"
+ACTIVE_POINTER = "ACTIVE"
+ARTIFACT_NAME = "model.pkl"
+METADATA_NAME = "metadata.json"
+
+
+class ModelRegistry:
+    """
+    Registro de modelos en disco:
+
+        model_registry/
+            ACTIVE                      -> {"version": "..."} (puntero al modelo en uso)
+            <version>/model.pkl         -> artefacto inmutable
+            <version>/metadata.json     -> filas, features, tiempo de entrenamiento, métricas, latencia
+
+    Cada versión se escribe en un directorio temporal y se renombra, y el puntero se
+    reemplaza con os.replace: rollback instantáneo sin reentrenar.
+    """
+
+    def __init__(self, root: str = MODEL_REGISTRY_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        # (signature del puntero, version) -> solo se relee ACTIVE cuando cambia
+        self._active_cache = (None, None)
+
+    def _pointer_path(self) -> str:
+        return os.path.join(self.root, ACTIVE_POINTER)
+
+    def artifact_path(self, version: str) -> str:
+        return os.path.join(self.root, version, ARTIFACT_NAME)
+
+    def register(self, model, metadata: dict, activate: bool = True) -> str:
+        """Guarda un nuevo modelo con su metadata y devuelve su versión."""
+        os.makedirs(self.root, exist_ok=True)
+        tmp_dir = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp_dir)
+        try:
+            artifact = os.path.join(tmp_dir, ARTIFACT_NAME)
+            joblib.dump(model, artifact)
+            with open(artifact, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()[:8]
+
+            version = time.strftime("v%Y%m%d-%H%M%S") + f"-{digest}"
+            metadata = dict(metadata, version=version, sha256_prefix=digest, created_at=time.time())
+            atomic_write_json(metadata, os.path.join(tmp_dir, METADATA_NAME), indent=2, default=str)
+
+            os.rename(tmp_dir, os.path.join(self.root, version))
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        if activate:
+            self.activate(version)
+        return version
+
+    def activate(self, version: str):
+        if not os.path.exists(self.artifact_path(version)):
+            raise ValueError(f"Unknown model version: {version}")
+        with self._lock:
+            atomic_write_json({"version": version, "activated_at": time.time()}, self._pointer_path())
+
+    def active_version(self):
+        """Versión activa (o None). El fichero ACTIVE solo se relee si cambia su mtime."""
+        try:
+            st = os.stat(self._pointer_path())
+        except OSError:
+            return None
+        signature = (st.st_mtime_ns, st.st_size)
+        cached_signature, version = self._active_cache
+        if signature == cached_signature:
+            return version
+
+        try:
+            with open(self._pointer_path()) as f:
+                version = json.load(f).get("version")
+        except (OSError, ValueError):
+            return self._active_cache[1]
+        self._active_cache = (signature, version)
+        return version
+
+    def get_metadata(self, version: str) -> dict:
+        with open(os.path.join(self.root, version, METADATA_NAME)) as f:
+            return json.load(f)
+
+    def list_versions(self) -> list:
+        """Metadata de todas las versiones, la más reciente primero."""
+        if not os.path.isdir(self.root):
+            return []
+        active = self.active_version()
+        versions = []
+        for name in os.listdir(self.root):
+            if name.startswith(".") or not os.path.exists(self.artifact_path(name)):
+                continue
+            try:
+                metadata = self.get_metadata(name)
+            except (OSError, ValueError):
+                metadata = {"version": name}
+            metadata["active"] = name == active
+            versions.append(metadata)
+        versions.sort(key=lambda m: m.get("created_at", 0), reverse=True)
+        return versions
+
+
+model_registry = ModelRegistry()
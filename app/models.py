@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Boolean, Enum, Float
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Boolean, Enum, Float, UniqueConstraint
 from sqlalchemy.orm import relationship, DeclarativeBase
 from datetime import datetime
 import enum
@@ -19,6 +19,12 @@ class AlertLevel(enum.Enum):
     HIGH = "high"
     CRITICAL = "critical" # Dispara notificación inmediata
 
+class OutboxStatus(enum.Enum):
+    PENDING = "pending"       # Esperando al dispatcher (o a su próximo reintento)
+    PROCESSING = "processing" # Reclamada por un dispatcher
+    SENT = "sent"
+    FAILED = "failed"         # Agotados los reintentos
+
 # --- TABLAS ---
 
 class School(Base):
@@ -102,6 +108,10 @@ class SurveyResponse(Base):
     calculated_risk_score = Column(Integer) # 0 a 100
     risk_level = Column(Enum(AlertLevel))
     ai_summary = Column(Text) # Resumen generado por LangChain
+    # Entradas de la puntuación en el momento del envío (re-puntuar sin depender del estado actual).
+    # Null en encuestas anteriores a estas columnas
+    teacher_sentiment = Column(Float, nullable=True) # Ambiente de clase del profesor
+    text_risk = Column(Float, nullable=True) # score_text_risk del texto libre (None si el modo no tiene)
     
     # Feedback del Experto (Human-in-the-Loop)
     # Valores: "false_positive", "false_negative", "real_case", null
@@ -122,6 +132,49 @@ class ChatMessage(Base):
 
     user = relationship("User", back_populates="chat_history")
 
+class SubmissionKey(Base):
+    """
+    Clave de idempotencia de un envío (cabecera Idempotency-Key). Un reintento con la misma
+    clave devuelve la respuesta guardada sin volver a puntuar, insertar ni alertar.
+    """
+    __tablename__ = "submission_keys"
+    __table_args__ = (UniqueConstraint("user_id", "key", name="uq_submission_keys_user_key"),)
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    key = Column(String(128), nullable=False)
+    request_hash = Column(String(64)) # Huella del cuerpo: misma clave con otro contenido -> 409
+    survey_id = Column(Integer, ForeignKey("survey_responses.id"), nullable=True) # Null en envíos masivos
+    response = Column(Text) # JSON de la respuesta original
+    created_at = Column(DateTime, default=datetime.utcnow, index=True) # Caduca a las IDEMPOTENCY_TTL_H horas
+
+    survey = relationship("SurveyResponse")
+
+class AlertOutbox(Base):
+    """
+    Alerta pendiente de enviar al profesor (plan de acción + email). Se inserta en la misma
+    transacción que la encuesta y la procesa un dispatcher aparte (app/alert_outbox.py),
+    así una alerta no se pierde si el servidor se reinicia y el envío no espera al LLM ni al SMTP.
+    """
+    __tablename__ = "alert_outbox"
+    id = Column(Integer, primary_key=True, index=True)
+    survey_id = Column(Integer, ForeignKey("survey_responses.id"), nullable=True)
+    student_id = Column(Integer, ForeignKey("students.id"))
+    student_code = Column(String) # internal_code en el momento de la alerta
+    recipient_email = Column(String)
+    risk_level = Column(Enum(AlertLevel))
+    payload = Column(Text) # JSON del RiskAnalysisResult
+
+    status = Column(Enum(OutboxStatus), default=OutboxStatus.PENDING, index=True)
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, index=True)
+    claimed_by = Column(String, nullable=True) # Token del dispatcher que la procesa
+    claimed_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    survey = relationship("SurveyResponse")
+
 class ClassObservation(Base):
     __tablename__ = "class_observations"
     id = Column(Integer, primary_key=True, index=True)
@@ -129,6 +182,24 @@ class ClassObservation(Base):
     content = Column(Text)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
+    # Sentimiento precalculado al guardar (utils/text_analysis.score_observation)
+    # Null en filas antiguas hasta ejecutar scripts/backfill_observation_sentiment.py
+    neg_count = Column(Integer, nullable=True)
+    pos_count = Column(Integer, nullable=True)
+    row_risk = Column(Float, nullable=True)
+
+class TeacherAtmosphere(Base):
+    """
+    Puntuación de ambiente de clase vigente por profesor (media de las últimas observaciones).
+    Se recalcula al guardar cada observación (app/atmosphere.py) y se lee por clave primaria.
+    """
+    __tablename__ = "teacher_atmosphere"
+    teacher_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    score = Column(Float, default=0.0)
+    observation_count = Column(Integer, default=0) # Observaciones usadas (máx. ventana)
+    last_observation_id = Column(Integer, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
 class AuditLog(Base):
     __tablename__ = "audit_logs"
     id = Column(Integer, primary_key=True, index=True)
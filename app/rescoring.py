@@ -0,0 +1,179 @@
+import json
+import time
+import numpy as np
+from collections import defaultdict
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from .database import engine
+from .models import SurveyResponse, Student
+from .agents.predictor import (
+    HeuristicPredictor, BulkRiskResult, answers_to_matrix, RISK_LEVELS, rule_plan
+)
+from .utils.text_analysis import score_text_risk
+from .utils.files import atomic_write_json
+from .atmosphere import get_teacher_sentiments_bulk
+
+RESCORE_CHECKPOINT_PATH = "rescore_checkpoint.json"
+RESCORE_CHUNK_SIZE = 2000
+
+# Sentimiento del profesor al re-puntuar:
+# "stored" el guardado con la encuesta al enviarla (sin sentimiento si es anterior a esa columna),
+# "current" el ambiente de clase actual del profesor (cambia filas aunque no cambie ningún umbral),
+# "none" sin sentimiento
+SENTIMENT_SOURCES = ("stored", "current", "none")
+
+
+def _read_checkpoint(path: str) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _fetch_chunk(db: Session, last_id: int, chunk_size: int):
+    # Keyset pagination: cada lectura es corta y no mantiene abierta una transacción larga
+    return db.query(
+        SurveyResponse.id,
+        SurveyResponse.raw_answers,
+        SurveyResponse.calculated_risk_score,
+        SurveyResponse.risk_level,
+        SurveyResponse.ai_summary,
+        SurveyResponse.teacher_sentiment,
+        SurveyResponse.text_risk,
+        Student.teacher_id
+    ).outerjoin(Student, SurveyResponse.student_id == Student.id)\
+        .filter(SurveyResponse.raw_answers.isnot(None), SurveyResponse.id > last_id)\
+        .order_by(SurveyResponse.id)\
+        .limit(chunk_size).all()
+
+
+def _row_sentiment(r, sentiment_source: str, teacher_sentiments: dict) -> float:
+    if sentiment_source == "stored":
+        return r.teacher_sentiment or 0.0
+    if sentiment_source == "current" and r.teacher_id:
+        return teacher_sentiments.get(r.teacher_id, 0.0)
+    return 0.0
+
+
+def _score_chunk(rows, sentiment_source: str = "stored", teacher_sentiments: dict = None):
+    """
+    Returns {survey_id: (score, AlertLevel)} para las filas del bloque, en modo vectorizado.
+    Cada encuesta va al modo que le asigna rule_plan.mode_for (detect_field de risk_rules.json),
+    igual que analyze() y analyze_many(); una evaluación por modo.
+    El text_risk es el guardado con la encuesta; solo se recalcula del texto en filas antiguas sin él.
+    """
+    teacher_sentiments = teacher_sentiments or {}
+    groups = defaultdict(list)
+    for r in rows:
+        try:
+            answers = json.loads(r.raw_answers)
+        except (TypeError, ValueError):
+            continue
+        groups[rule_plan.mode_for(answers).name].append((r, answers))
+
+    scored = {}
+    for name, group in groups.items():
+        mode = rule_plan.modes[name]
+        answers = [a for _, a in group]
+        # El modo ignora el sentimiento si no tiene sentiment_boost (encuestas de profesor)
+        sentiments = np.array([_row_sentiment(r, sentiment_source, teacher_sentiments) for r, _ in group])
+        text_risk = None
+        if mode.text_field:
+            text_risk = np.array([
+                r.text_risk if r.text_risk is not None else score_text_risk(a.get(mode.text_field)) for r, a in group
+            ], dtype=np.float64)
+        result = BulkRiskResult(*mode.evaluate(answers_to_matrix(answers, mode.fields), sentiments, text_risk))
+        for (r, _), score, level in zip(group, result.scores, result.levels):
+            scored[r.id] = (int(score), RISK_LEVELS[level])
+    return scored
+
+
+def rescore_surveys(chunk_size: int = RESCORE_CHUNK_SIZE, checkpoint_path: str = RESCORE_CHECKPOINT_PATH,
+                    resume: bool = True, sentiment_source: str = "stored", dry_run: bool = False,
+                    pause: float = 0.0, progress=None) -> dict:
+    """
+    Re-puntúa survey_responses con los umbrales actuales del motor heurístico.
+
+    - Lee por bloques (keyset sobre id) y escribe solo las filas cuyo score/nivel cambia,
+      con un UPDATE masivo por bloque y commit inmediato: el fichero SQLite solo queda
+      bloqueado lo que dura cada bloque.
+    - Guarda un checkpoint (último id procesado + contadores) tras cada bloque; si el job se
+      interrumpe, resume=True continúa desde ahí.
+    - sentiment_source (SENTIMENT_SOURCES): por defecto "stored", el sentimiento guardado con
+      cada encuesta, así una fila solo cambia si cambian las reglas. "current" usa el ambiente de
+      clase actual del profesor y debe pedirse explícitamente: reescribe encuestas que ya alertaron.
+    """
+    if sentiment_source not in SENTIMENT_SOURCES:
+        raise ValueError(f"sentiment_source must be one of {SENTIMENT_SOURCES}")
+    checkpoint = _read_checkpoint(checkpoint_path) if resume else {}
+    if (checkpoint.get("finished") or checkpoint.get("dry_run", dry_run) != dry_run
+            or checkpoint.get("sentiment_source", sentiment_source) != sentiment_source):
+        checkpoint = {} # El último job terminó (o era de otro modo): empezamos uno nuevo
+    state = {
+        "last_id": checkpoint.get("last_id", 0),
+        "scanned": checkpoint.get("scanned", 0),
+        "changed": checkpoint.get("changed", 0),
+        "started_at": checkpoint.get("started_at", time.time()),
+        "finished": False,
+        "dry_run": dry_run,
+        "sentiment_source": sentiment_source,
+    }
+    if state["last_id"]:
+        print(f"Resuming re-scoring after survey id {state['last_id']} ({state['scanned']} already scanned)")
+
+    teacher_sentiments = {}
+    if sentiment_source == "current":
+        with Session(engine) as db:
+            teacher_sentiments = get_teacher_sentiments_bulk(db)
+
+    start = time.perf_counter()
+    scanned_this_run = 0
+    while True:
+        with Session(engine) as db:
+            rows = _fetch_chunk(db, state["last_id"], chunk_size)
+            if not rows:
+                break
+
+            scored = _score_chunk(rows, sentiment_source, teacher_sentiments)
+            changes = []
+            for r in rows:
+                if r.id not in scored:
+                    continue
+                score, level = scored[r.id]
+                if score == r.calculated_risk_score and level == r.risk_level:
+                    continue
+                change = {"id": r.id, "calculated_risk_score": score, "risk_level": level}
+                # El resumen solo se regenera si sigue siendo la recomendación estándar del nivel anterior
+                if r.risk_level and r.ai_summary == HeuristicPredictor._get_recommendation(r.risk_level):
+                    change["ai_summary"] = HeuristicPredictor._get_recommendation(level)
+                changes.append(change)
+
+            if changes and not dry_run:
+                # Bulk UPDATE por clave primaria (executemany)
+                with_summary = [c for c in changes if "ai_summary" in c]
+                without_summary = [c for c in changes if "ai_summary" not in c]
+                for batch in (with_summary, without_summary):
+                    if batch:
+                        db.execute(update(SurveyResponse), batch)
+                db.commit()
+
+        state["last_id"] = rows[-1].id
+        state["scanned"] += len(rows)
+        state["changed"] += len(changes)
+        scanned_this_run += len(rows)
+        atomic_write_json(state, checkpoint_path)
+        if progress:
+            progress(state)
+        if pause:
+            time.sleep(pause) # Deja pasar escrituras de los workers web entre bloques
+
+    elapsed = time.perf_counter() - start
+    state["finished"] = True
+    state["finished_at"] = time.time()
+    atomic_write_json(state, checkpoint_path)
+
+    rate = scanned_this_run / elapsed if elapsed > 0 else float(scanned_this_run)
+    print(f"Re-scoring {'(dry run) ' if dry_run else ''}finished: {state['scanned']} scanned, "
+          f"{state['changed']} changed ({rate:.0f} rows/s)")
+    return state
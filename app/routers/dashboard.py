@@ -311,10 +311,9 @@ def view_case_details(request: Request, survey_id: int, current_user: User = Dep
     ml_analysis = "No analysis available"
     try:
         import json
-        from app.ml_engine import predict_risk, MODEL_PATH
-        import os
+        from app.ml_engine import predict_risk, model_holder
         
-        if os.path.exists(MODEL_PATH) and survey.raw_answers:
+        if model_holder.get() is not None and survey.raw_answers:
              answers = json.loads(survey.raw_answers)
              ml_prob, ml_analysis = predict_risk(answers)
              ml_prob = round(ml_prob * 100, 1)
@@ -693,3 +692,52 @@ def view_school_detail_as_admin(request: Request, school_id: int, current_user:
         "school_color": school_color,
         "classrooms": classroom_list
     })
+
+# --- ML ENGINE (SUPER ADMIN) ---
+
+@router.get("/api/ml/status")
+def ml_engine_status(current_user: User = Depends(get_current_user)):
+    if current_user.role != UserRole.SUPER_ADMIN:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+
+    from ..ml_engine import model_holder
+    from ..training_jobs import training_runner
+    return JSONResponse(content={
+        "model": model_holder.stats(),
+        "training": training_runner.status()
+    })
+
+@router.post("/api/ml/retrain")
+def ml_engine_retrain(current_user: User = Depends(get_current_user)):
+    if current_user.role != UserRole.SUPER_ADMIN:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+
+    # El entrenamiento corre en otro proceso: esta petición vuelve inmediatamente
+    from ..training_jobs import training_runner
+    started, status = training_runner.start()
+    if not started:
+        return JSONResponse(status_code=409, content={"message": "Ya hay un reentrenamiento en curso.", "training": status})
+
+    return JSONResponse(status_code=202, content={"message": "Reentrenamiento iniciado.", "training": status})
+
+@router.get("/api/ml/models")
+def ml_model_versions(current_user: User = Depends(get_current_user)):
+    if current_user.role != UserRole.SUPER_ADMIN:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+
+    from ..model_registry import model_registry
+    return JSONResponse(content={"models": model_registry.list_versions()})
+
+@router.post("/api/ml/models/{version}/activate")
+def ml_activate_model(version: str, current_user: User = Depends(get_current_user)):
+    if current_user.role != UserRole.SUPER_ADMIN:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+
+    # Rollback / promoción instantánea: los workers recogen el puntero en su próxima comprobación
+    from ..model_registry import model_registry
+    try:
+        model_registry.activate(version)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Versión de modelo no encontrada")
+
+    return JSONResponse(content={"message": f"Modelo {version} activado.", "active": version})
@@ -1,12 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, Form
+from fastapi import APIRouter, Depends, HTTPException, Request, Form, File, UploadFile, Header
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from typing import List, Optional
+from collections import Counter
+from datetime import datetime
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
-from ..database import get_db
-from ..schemas import SurveyInput, RiskAnalysisResult
-from ..agents.predictor import heuristic_engine
-from ..models import SurveyResponse, AlertLevel, User, Student
-from ..security import get_current_user
+from sqlalchemy import select, insert, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_db, get_async_db, async_write_lock
+from ..schemas import SurveyInput, RiskAnalysisResult, BulkSurveyItem, BulkRowResult, BulkSubmitResult
+from ..agents.predictor import heuristic_engine, survey_text_risk
+from ..models import SurveyResponse, AlertLevel, User, Student, UserRole, SubmissionKey, AlertOutbox
+from ..alert_outbox import needs_alert, outbox_values
+from ..idempotency import IDEMPOTENCY_HEADER, validate_key, request_fingerprint, find_replay, remember
+from ..security import get_current_user, get_current_user_async
 import json
 
 router = APIRouter(prefix="/surveys", tags=["surveys"])
@@ -19,70 +29,279 @@ def get_parent_survey(request: Request, current_user: User = Depends(get_current
         "user": current_user
     })
 
-from fastapi import BackgroundTasks
-from ..agents.incident_responder import incident_responder
+async def _commit_or_replay(db: AsyncSession, user_id: int, key: Optional[str], request_hash: Optional[str],
+                            response: str, write=None) -> Optional[str]:
+    """
+    Commit del envío (ya añadido a la sesión, con su SubmissionKey si hay clave). write:
+    corutina opcional (INSERTs masivos) que se ejecuta dentro del mismo lock y transacción.
+    Si otro intento con la misma Idempotency-Key se guardó mientras puntuábamos, el índice único
+    lo rechaza: se deshace y se devuelve la respuesta del que ganó. Returns None si este envío se guardó.
+    """
+    async with async_write_lock:
+        try:
+            if write is not None:
+                await write()
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            # Ya dentro del lock: no se purga (la clave que ha chocado es de otro intento reciente)
+            replay = await find_replay(db, user_id, key, request_hash, purge_expired=False) if key else None
+            if replay is None:
+                raise
+            return replay
+    if key:
+        remember(user_id, key, request_hash, response)
+    return None
 
 @router.post("/api/submit", response_model=RiskAnalysisResult)
-def submit_survey(
+async def submit_survey(
     survey_data: SurveyInput, 
     student_id: int,
-    background_tasks: BackgroundTasks,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)
 ):
+    # Async: el worker atiende otros envíos mientras espera a la BD (picos de campaña)
     user_id = current_user.id
-    # 1. Verificar existencia (Básico)
-    student = db.query(Student).filter(Student.id == student_id).first()
+    
+    # 0. Reintento de un envío ya procesado -> misma respuesta, sin puntuar, insertar ni alertar
+    key = validate_key(idempotency_key)
+    request_hash = None
+    if key:
+        request_hash = request_fingerprint({"student_id": student_id, "survey": survey_data.model_dump(exclude_none=True)})
+        replay = await find_replay(db, user_id, key, request_hash)
+        if replay is not None:
+            return RiskAnalysisResult.model_validate_json(replay)
+    
+    # 1. Verificar existencia (Básico) - alumno + profesor en una sola query
+    student = (await db.execute(
+        select(Student).options(joinedload(Student.teacher)).where(Student.id == student_id)
+    )).scalars().first()
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
 
     # 2. Calcular Sentimiento del Profesor (Contexto)
     teacher_sentiment = 0.0
     if student.teacher_id:
-        from ..models import ClassObservation
-        from ..utils.text_analysis import calculate_atmosphere_score
+        from ..atmosphere import get_teacher_atmosphere
         
-        # Últimas 5 observaciones
-        observations = db.query(ClassObservation)\
-            .filter(ClassObservation.teacher_id == student.teacher_id)\
-            .order_by(ClassObservation.timestamp.desc())\
-            .limit(5).all()
-        
-        teacher_sentiment = calculate_atmosphere_score(observations)
+        # Puntuación materializada (últimas 5 observaciones), lectura por clave primaria
+        teacher_sentiment = await db.run_sync(get_teacher_atmosphere, student.teacher_id)
 
     # 3. Análisis del Agente
     analysis = heuristic_engine.analyze(survey_data, teacher_sentiment)
     
-    # 3. Persistencia en BD
+    # 3. Persistencia en BD (sin refresh: la respuesta no necesita nada generado por la BD)
     db_survey = SurveyResponse(
         submitted_by_id=user_id,
         student_id=student_id,
         raw_answers=survey_data.model_dump_json(exclude_none=True),
         calculated_risk_score=analysis.total_score,
         risk_level=AlertLevel(analysis.risk_level), # Convertir string a Enum
-        ai_summary=analysis.recommendation
+        ai_summary=analysis.recommendation,
+        # Entradas de la puntuación: rescore_surveys las reutiliza (cacheado: analyze ya lo calculó)
+        teacher_sentiment=teacher_sentiment,
+        text_risk=survey_text_risk(survey_data.model_dump())
     )
     
+    response = analysis.model_dump_json()
     db.add(db_survey)
-    db.commit()
-    db.refresh(db_survey)
-    
-    # 4. Invocación al Agente de Respuesta (Si es necesario)
-    if analysis.risk_level in ["high", "critical"] and student.teacher_id:
-        # Recuperar email del profesor
-        teacher_email = "profesor_demo@colegio.com"
-        if student.teacher and student.teacher.email:
-             teacher_email = student.teacher.email
-             
-        background_tasks.add_task(
-            incident_responder.handle_alert, 
-            student, 
-            analysis, 
-            teacher_email
-        )
+    # 4. Alerta high/critical al outbox, en la misma transacción: la envía el dispatcher
+    # (scripts/run_alert_dispatcher.py), así el envío no espera al LLM ni al SMTP
+    if needs_alert(student, analysis):
+        db.add(AlertOutbox(**outbox_values(student, analysis), survey=db_survey))
+    if key:
+        db.add(SubmissionKey(user_id=user_id, key=key, request_hash=request_hash, survey=db_survey, response=response))
+    replay = await _commit_or_replay(db, user_id, key, request_hash, response)
+    if replay is not None:
+        return RiskAnalysisResult.model_validate_json(replay)
     
     return analysis
 
+# --- Envío masivo (cribados de curso / centro completo) ---
+
+MAX_BULK_ROWS = 2000
+MAX_BULK_FILE_BYTES = 5 * 1024 * 1024
+
+def _parse_bulk_file(filename: str, content: bytes) -> list:
+    """CSV/XLSX -> lista de dicts, una encuesta por fila (cabeceras = campos de BulkSurveyItem)."""
+    import io
+    import pandas as pd
+    
+    name = (filename or "").lower()
+    try:
+        if name.endswith(".csv"):
+            df = pd.read_csv(io.BytesIO(content), dtype=object)
+        elif name.endswith(".xlsx"):
+            df = pd.read_excel(io.BytesIO(content), dtype=object)
+        else:
+            raise HTTPException(status_code=400, detail="Formato no soportado: usa un fichero .csv o .xlsx")
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"No se pudo leer el fichero: {e}")
+    
+    df = df.dropna(how="all")
+    rows = []
+    for record in df.to_dict(orient="records"):
+        row = {str(k).strip(): v for k, v in record.items() if not pd.isna(v)}
+        if "internal_code" in row:
+            row["internal_code"] = str(row["internal_code"]).strip()
+        rows.append(row)
+    return rows
+
+def _can_submit_for(user: User, student: Student) -> bool:
+    # Mismo criterio que el detalle de caso del dashboard
+    if user.role == UserRole.SUPER_ADMIN:
+        return True
+    if user.role == UserRole.SCHOOL_ADMIN:
+        return student.school_id == user.school_id
+    return student.teacher_id == user.id
+
+async def _submit_bulk(raw_rows: list, current_user: User, db: AsyncSession,
+                       idempotency_key: Optional[str] = None) -> BulkSubmitResult:
+    """
+    Valida todas las filas, resuelve los alumnos en una query, puntúa el lote con analyze_many,
+    inserta con un único INSERT masivo y deja las alertas high/critical en el outbox.
+    Todo o nada: si alguna fila falla no se guarda ninguna (422 con la lista de errores).
+    Con Idempotency-Key, reenviar el mismo lote devuelve el resultado original.
+    """
+    if current_user.role not in [UserRole.TEACHER, UserRole.SCHOOL_ADMIN, UserRole.SUPER_ADMIN]:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    user_id = current_user.id
+    key = validate_key(idempotency_key)
+    request_hash = None
+    if key:
+        request_hash = request_fingerprint([r.model_dump(exclude_none=True) if isinstance(r, BulkSurveyItem) else r for r in raw_rows])
+        replay = await find_replay(db, user_id, key, request_hash)
+        if replay is not None:
+            return BulkSubmitResult.model_validate_json(replay)
+    if not raw_rows:
+        raise HTTPException(status_code=400, detail="El lote está vacío")
+    if len(raw_rows) > MAX_BULK_ROWS:
+        raise HTTPException(status_code=413, detail=f"Máximo {MAX_BULK_ROWS} encuestas por envío")
+
+    # 1. Validación de todas las filas
+    errors = []
+    items = []
+    for row, raw in enumerate(raw_rows):
+        try:
+            item = raw if isinstance(raw, BulkSurveyItem) else BulkSurveyItem.model_validate(raw)
+        except ValidationError as e:
+            errors.append({"row": row, "error": "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())})
+            continue
+        if item.student_id is None and not item.internal_code:
+            errors.append({"row": row, "error": "Falta student_id o internal_code"})
+            continue
+        items.append((row, item))
+
+    # 2. Alumnos (+ profesor para las alertas) en una sola query
+    ids = {item.student_id for _, item in items if item.student_id is not None}
+    codes = {item.internal_code for _, item in items if item.student_id is None}
+    students = (await db.execute(
+        select(Student).options(joinedload(Student.teacher))
+        .where(or_(Student.id.in_(ids), Student.internal_code.in_(codes)))
+    )).scalars().all()
+    by_id = {s.id: s for s in students}
+    by_code = {s.internal_code: s for s in students}
+
+    resolved = []
+    for row, item in items:
+        student = by_id.get(item.student_id) if item.student_id is not None else by_code.get(item.internal_code)
+        if student is None:
+            errors.append({"row": row, "error": "Student not found"})
+        elif not _can_submit_for(current_user, student):
+            errors.append({"row": row, "error": "Alumno fuera de tu centro/clase"})
+        else:
+            resolved.append((row, item, student))
+
+    if errors:
+        raise HTTPException(status_code=422, detail={"message": "Lote rechazado: ninguna encuesta guardada", "errors": sorted(errors, key=lambda e: e["row"])})
+
+    # 3. Contexto de clase de todos los profesores implicados y puntuación del lote
+    from ..atmosphere import get_teacher_sentiments_bulk
+    teacher_ids = list({s.teacher_id for _, _, s in resolved if s.teacher_id})
+    sentiments = await db.run_sync(get_teacher_sentiments_bulk, teacher_ids) if teacher_ids else {}
+
+    id_fields = {"student_id", "internal_code"}
+    answers = [item.model_dump(exclude=id_fields) for _, item, _ in resolved]
+    row_sentiments = [sentiments.get(s.teacher_id, 0.0) if s.teacher_id else 0.0 for _, _, s in resolved]
+    analyses = heuristic_engine.analyze_many(answers, row_sentiments)
+
+    # 4. Filas para el INSERT masivo
+    now = datetime.utcnow()
+    values = [{
+        "submitted_by_id": user_id,
+        "student_id": student.id,
+        "date_submitted": now,
+        "raw_answers": item.model_dump_json(exclude_none=True, exclude=id_fields),
+        "calculated_risk_score": analysis.total_score,
+        "risk_level": AlertLevel(analysis.risk_level),
+        "ai_summary": analysis.recommendation,
+        "teacher_sentiment": sentiment,
+        "text_risk": survey_text_risk(row_answers)
+    } for (_, item, student), analysis, sentiment, row_answers in zip(resolved, analyses, row_sentiments, answers)]
+    alert_rows = [
+        (i, student, analysis) for i, ((_, _, student), analysis) in enumerate(zip(resolved, analyses))
+        if needs_alert(student, analysis)
+    ]
+    levels = Counter(analysis.risk_level for analysis in analyses)
+    result = BulkSubmitResult(
+        received=len(raw_rows),
+        inserted=len(values),
+        risk_levels={level.value: levels.get(level.value, 0) for level in AlertLevel},
+        alerts_queued=len(alert_rows),
+        results=[
+            BulkRowResult(row=row, student_id=student.id, total_score=analysis.total_score,
+                          risk_level=analysis.risk_level, flags=analysis.flags)
+            for (row, _, student), analysis in zip(resolved, analyses)
+        ]
+    )
+
+    response = result.model_dump_json()
+    if key:
+        db.add(SubmissionKey(user_id=user_id, key=key, request_hash=request_hash, response=response))
+
+    async def write():
+        # Un único INSERT masivo (executemany) y las alertas high/critical al outbox,
+        # en la misma transacción que la clave
+        survey_ids = (await db.execute(
+            insert(SurveyResponse).returning(SurveyResponse.id, sort_by_parameter_order=True), values
+        )).scalars().all()
+        if alert_rows:
+            await db.execute(insert(AlertOutbox), [
+                outbox_values(student, analysis, survey_ids[i]) for i, student, analysis in alert_rows
+            ])
+
+    replay = await _commit_or_replay(db, user_id, key, request_hash, response, write=write)
+    if replay is not None:
+        return BulkSubmitResult.model_validate_json(replay)
+
+    return result
+
+@router.post("/api/submit/bulk", response_model=BulkSubmitResult)
+async def submit_survey_bulk(
+    surveys: List[dict],
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)
+):
+    """Lote JSON: [{"student_id": 1, "p_item_1": 2, ...}, {"internal_code": "A123", ...}]"""
+    return await _submit_bulk(surveys, current_user, db, idempotency_key)
+
+@router.post("/api/submit/bulk/upload", response_model=BulkSubmitResult)
+async def submit_survey_bulk_upload(
+    file: UploadFile = File(...),
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)
+):
+    """Lote desde CSV/XLSX: una fila por encuesta, columna student_id o internal_code + campos del formulario."""
+    content = await file.read()
+    if len(content) > MAX_BULK_FILE_BYTES:
+        raise HTTPException(status_code=413, detail="Fichero demasiado grande (máx. 5 MB)")
+    # Parseo (pandas) fuera del event loop
+    rows = await run_in_threadpool(_parse_bulk_file, file.filename, content)
+    return await _submit_bulk(rows, current_user, db, idempotency_key)
+
 # --- Teacher Routes ---
 
 @router.get("/teacher/student-report", response_class=HTMLResponse)
@@ -127,12 +346,23 @@ def teacher_class_report_submit(
     db: Session = Depends(get_db)
 ):
     from ..models import ClassObservation
+    from ..utils.text_analysis import score_observation
     
+    # Sentimiento calculado una sola vez, al escribir
+    neg_count, pos_count, row_risk = score_observation(content)
     observation = ClassObservation(
         teacher_id=current_user.id,
-        content=content
+        content=content,
+        neg_count=neg_count,
+        pos_count=pos_count,
+        row_risk=row_risk
     )
     db.add(observation)
+    db.flush()
+    
+    # Nueva observación -> recalcular el ambiente de clase del profesor (misma transacción)
+    from ..atmosphere import refresh_teacher_atmosphere
+    refresh_teacher_atmosphere(db, current_user.id)
     db.commit()
     
     return templates.TemplateResponse("forms/class_report.html", {
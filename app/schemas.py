@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Optional, Dict
 from enum import Enum
 
 # --- ENUMS para las Respuestas ---
@@ -77,6 +77,26 @@ class RiskAnalysisResult(BaseModel):
     flags: List[str] # Lista de alertas específicas (ej: "Daño material detectado")
     recommendation: str
 
+# --- Envío masivo (cribados de curso completo) ---
+class BulkSurveyItem(SurveyInput):
+    # Alumno: id interno o código del alumno (internal_code)
+    student_id: Optional[int] = None
+    internal_code: Optional[str] = None
+
+class BulkRowResult(BaseModel):
+    row: int # Posición en el lote (0 = primera fila de datos)
+    student_id: int
+    total_score: int
+    risk_level: str
+    flags: List[str]
+
+class BulkSubmitResult(BaseModel):
+    received: int
+    inserted: int
+    risk_levels: Dict[str, int] # Nº de encuestas por nivel
+    alerts_queued: int
+    results: List[BulkRowResult]
+
 # --- Schemas de Usuario ---
 class UserCreate(BaseModel):
     email: str
@@ -4,8 +4,10 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import Depends, HTTPException, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from .database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import get_db, get_async_db
 from .models import User
 
 # Configuración (En prod usar variables de entorno)
@@ -108,20 +110,46 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    credentials_exception = HTTPException(
+    email = _email_from_token(token_to_validate)
+        
+    user = db.query(User).filter(User.email == email).first()
+    if user is None:
+        raise _credentials_exception()
+    return user
+
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _email_from_token(token: str) -> str:
     try:
-        payload = jwt.decode(token_to_validate, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
         if email is None:
-            raise credentials_exception
+            raise _credentials_exception()
     except JWTError:
-        raise credentials_exception
-        
-    user = db.query(User).filter(User.email == email).first()
+        raise _credentials_exception()
+    return email
+
+async def get_current_user_async(
+    request: Request,
+    token: Optional[str] = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Igual que get_current_user, pero con la sesión async (para endpoints async def)."""
+    token_to_validate = token or request.cookies.get("access_token")
+    if not token_to_validate:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    email = _email_from_token(token_to_validate)
+
+    user = (await db.execute(select(User).where(User.email == email))).scalars().first()
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
     return user
@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import uuid
+import multiprocessing
+from .utils.files import atomic_write_json
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+# Estado compartido entre workers de uvicorn (cada worker es un proceso distinto)
+TRAINING_STATUS_PATH = "model_training_status.json"
+
+# Peso de cada fase en el progreso global del job
+STAGE_WEIGHTS = {"extracting": (0.0, 0.4), "fitting": (0.4, 0.95), "saving": (0.95, 1.0)}
+
+
+def _write_status(status: dict, path: str = TRAINING_STATUS_PATH):
+    # Escritura atómica: el endpoint nunca lee un JSON a medias
+    atomic_write_json(status, path)
+
+
+def read_status(path: str = TRAINING_STATUS_PATH) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"state": "idle"}
+
+
+def _pid_alive(pid) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+class _JobLock:
+    """
+    Lock exclusivo entre procesos sobre <status_path>.lock (flock; msvcrt.locking en Windows).
+    Lo tiene el worker que lanza el job y después el proceso hijo hasta terminar.
+    El sistema operativo lo libera si el proceso muere, así que nunca queda un lock huérfano.
+    """
+
+    def __init__(self, status_path: str):
+        self.path = status_path + ".lock"
+        self._fd = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        fd = os.open(self.path, os.O_CREAT | os.O_RDWR)
+        while True:
+            try:
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                else:
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                self._fd = fd
+                return True
+            except OSError:
+                if not blocking:
+                    os.close(fd)
+                    return False
+                time.sleep(0.1)
+
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            if fcntl:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+def _run_training_job(job_id: str, status_path: str):
+    """
+    Punto de entrada del proceso hijo. Se importa ml_engine aquí para que el proceso
+    web no cargue sklearn/pandas por el simple hecho de lanzar el job.
+    """
+    # Espera a que el worker que lo lanzó suelte el lock y lo mantiene hasta terminar
+    lock = _JobLock(status_path)
+    lock.acquire()
+    try:
+        _train(job_id, status_path)
+    finally:
+        lock.release()
+
+
+def _train(job_id: str, status_path: str):
+    from . import ml_engine
+
+    status = {
+        "job_id": job_id,
+        "state": "running",
+        "stage": "starting",
+        "progress": 0.0,
+        "pid": os.getpid(),
+        "started_at": time.time(),
+        "finished_at": None,
+        "duration_s": None,
+        "error": None,
+        "model_version": None,
+    }
+    _write_status(status, status_path)
+
+    def report(stage, fraction):
+        low, high = STAGE_WEIGHTS.get(stage, (0.0, 1.0))
+        status["stage"] = stage
+        status["progress"] = round(low + (high - low) * fraction, 3)
+        _write_status(status, status_path)
+
+    try:
+        trained = ml_engine.train_model(n_jobs=-1, progress=report)
+        status["state"] = "finished" if trained else "no_data"
+        status["stage"] = "done"
+        status["progress"] = 1.0
+        status["model_version"] = trained or None
+    except Exception as e:
+        status["state"] = "failed"
+        status["error"] = str(e)
+        print(f"❌ Training job {job_id} failed: {e}")
+
+    status["finished_at"] = time.time()
+    status["duration_s"] = round(status["finished_at"] - status["started_at"], 2)
+    _write_status(status, status_path)
+
+
+class TrainingJobRunner:
+    """
+    Lanza train_model en un proceso separado (spawn) para que el reentrenamiento
+    nunca bloquee a los workers que atienden peticiones.
+    """
+
+    def __init__(self, status_path: str = TRAINING_STATUS_PATH):
+        self.status_path = status_path
+        self._ctx = multiprocessing.get_context("spawn")
+
+    def status(self) -> dict:
+        # Recoge procesos hijos terminados (evita zombies)
+        multiprocessing.active_children()
+        status = read_status(self.status_path)
+        if status.get("state") == "running" and not _pid_alive(status.get("pid")):
+            # El proceso murió sin escribir el estado final (kill, OOM...)
+            status["state"] = "failed"
+            status["error"] = "Training process exited unexpectedly"
+        return status
+
+    def is_running(self) -> bool:
+        return self.status().get("state") == "running"
+
+    def start(self):
+        """
+        Returns (started, status). Si ya hay un job en marcha no se lanza otro.
+        """
+        lock = _JobLock(self.status_path)
+        if not lock.acquire(blocking=False):
+            # Otro worker está lanzando un job o hay uno en marcha (el hijo tiene el lock)
+            return False, self.status()
+        try:
+            # Con el lock, la comprobación y el estado "queued" no pueden intercalarse con otro worker.
+            # Cubre además el instante entre que se suelta el lock y el hijo lo toma.
+            if self.is_running():
+                return False, self.status()
+
+            job_id = uuid.uuid4().hex[:8]
+            _write_status({"job_id": job_id, "state": "running", "stage": "queued", "progress": 0.0,
+                           "pid": os.getpid(), "started_at": time.time()}, self.status_path)
+
+            process = self._ctx.Process(target=_run_training_job, args=(job_id, self.status_path), daemon=False)
+            process.start()
+
+            status = read_status(self.status_path)
+            if status.get("job_id") == job_id and status.get("stage") == "queued":
+                # A partir de aquí la vida del job se mide por el pid del hijo
+                status["pid"] = process.pid
+                _write_status(status, self.status_path)
+            return True, status
+        finally:
+            lock.release()
+
+    def run_foreground(self, poll_interval: float = 1.0) -> dict:
+        """Lanza el job y espera mostrando el progreso (uso desde CLI)."""
+        started, status = self.start()
+        if not started:
+            print(f"A training job is already running: {status}")
+            return status
+
+        last = None
+        while True:
+            time.sleep(poll_interval)
+            status = self.status()
+            line = (status.get("stage"), status.get("progress"))
+            if line != last:
+                print(f"[{status.get('job_id')}] {status.get('stage')} {status.get('progress', 0) * 100:.0f}%")
+                last = line
+            if status.get("state") != "running":
+                return status
+
+
+training_runner = TrainingJobRunner()
@@ -1,40 +1,247 @@
 import smtplib
+import threading
+import time
+import os
+import uuid
+from queue import LifoQueue, Empty
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
 EMAIL_USER = os.getenv("EMAIL_USER")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
-SMTP_SERVER = "smtp.gmail.com"
-SMTP_PORT = 587
+EMAIL_FROM = os.getenv("EMAIL_FROM", EMAIL_USER)
+SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_AUTH = os.getenv("SMTP_AUTH", "true").lower() == "true" # false: servidor local de pruebas sin login
+SMTP_TIMEOUT_S = float(os.getenv("SMTP_TIMEOUT_S", "20")) # Un servidor colgado no bloquea el hilo indefinidamente
+
+# Conexiones autenticadas que se mantienen abiertas (el TLS + login de cada envío era la mayor parte del coste)
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+SMTP_MAX_IDLE_S = float(os.getenv("SMTP_MAX_IDLE_S", "60")) # Más inactiva que esto -> se comprueba con NOOP
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "100")) # Gmail corta sesiones largas
+
+# smtp (por defecto) | file (un .eml por mensaje en EMAIL_FILE_DIR) | memory (pruebas)
+EMAIL_BACKEND = os.getenv("EMAIL_BACKEND", "smtp")
+EMAIL_FILE_DIR = os.getenv("EMAIL_FILE_DIR", "sent_emails")
+
+
+def build_message(to_email: str, subject: str, body: str, sender: str = None) -> MIMEMultipart:
+    msg = MIMEMultipart()
+    msg['From'] = sender or EMAIL_FROM or ""
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'html'))
+    return msg
+
+
+class _Connection:
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.last_used = time.monotonic()
+        self.sent = 0
+
+
+class SMTPTransport:
+    """
+    Envío SMTP con un pool pequeño de conexiones autenticadas y persistentes.
+    Se reconecta si el servidor cierra la sesión y reintenta el mensaje una vez.
+    persistent=False abre y cierra una conexión por mensaje (comportamiento anterior, para comparar).
+    """
+
+    def __init__(self, host: str = SMTP_SERVER, port: int = SMTP_PORT, user: str = EMAIL_USER,
+                 password: str = EMAIL_PASSWORD, sender: str = EMAIL_FROM, starttls: bool = SMTP_STARTTLS,
+                 auth: bool = SMTP_AUTH, pool_size: int = SMTP_POOL_SIZE, timeout: float = SMTP_TIMEOUT_S,
+                 persistent: bool = True):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.sender = sender or user or "antibullying@localhost"
+        self.starttls = starttls
+        self.auth = auth
+        self.timeout = timeout
+        self.persistent = persistent
+        self._idle = LifoQueue() # LIFO: se reutiliza la conexión más reciente, las viejas caducan solas
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+    def _connect(self) -> _Connection:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                smtp.starttls()
+            if self.auth:
+                smtp.login(self.user, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        return _Connection(smtp)
+
+    @staticmethod
+    def _close(conn: _Connection):
+        try:
+            conn.smtp.quit()
+        except Exception:
+            conn.smtp.close()
+
+    def _acquire(self) -> _Connection:
+        if not self.persistent:
+            return self._connect()
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                return self._connect()
+            if time.monotonic() - conn.last_used < SMTP_MAX_IDLE_S:
+                return conn
+            # Inactiva mucho tiempo: el servidor puede haberla cerrado
+            try:
+                if conn.smtp.noop()[0] == 250:
+                    return conn
+            except Exception:
+                pass
+            self._close(conn)
+
+    def _release(self, conn: _Connection, broken: bool = False):
+        if broken or not self.persistent or conn.sent >= SMTP_MAX_MESSAGES_PER_CONNECTION:
+            self._close(conn)
+        else:
+            conn.last_used = time.monotonic()
+            self._idle.put(conn)
+
+    def _reconnect(self, conn: _Connection):
+        # Sustituye la sesión dentro del mismo objeto: quien lo tiene sigue con una conexión válida
+        self._close(conn)
+        fresh = self._connect()
+        conn.smtp, conn.sent = fresh.smtp, 0
+
+    def _send_one(self, conn: _Connection, msg):
+        """Envía por conn; si la sesión se cayó, reconecta y reintenta una vez."""
+        try:
+            conn.smtp.sendmail(self.sender, msg['To'], msg.as_string())
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            self._reconnect(conn)
+            conn.smtp.sendmail(self.sender, msg['To'], msg.as_string())
+        conn.sent += 1
+
+    def send_many(self, messages: list) -> list:
+        """Envía un lote por una misma sesión. Returns [bool] por mensaje (un fallo no corta el lote)."""
+        if not messages:
+            return []
+        if self.auth and not (self.user and self.password):
+            print("Error: Email credentials not found in environment variables.")
+            return [False] * len(messages)
+
+        results = []
+        with self._slots:
+            try:
+                conn = self._acquire()
+            except Exception as e:
+                print(f"Failed to send email: could not connect to {self.host}:{self.port}: {e}")
+                return [False] * len(messages)
+            broken = False
+            for msg in messages:
+                if broken:
+                    results.append(False)
+                    continue
+                try:
+                    if not self.persistent and conn.sent:
+                        self._reconnect(conn)
+                    self._send_one(conn, msg)
+                    results.append(True)
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+                    # Rechazo de este mensaje: la sesión sigue sirviendo para el resto
+                    print(f"Failed to send email to {msg['To']}: {e}")
+                    results.append(False)
+                except Exception as e:
+                    print(f"Failed to send email to {msg['To']}: {e}")
+                    results.append(False)
+                    broken = True
+            self._release(conn, broken)
+        return results
+
+    def close(self):
+        while True:
+            try:
+                self._close(self._idle.get_nowait())
+            except Empty:
+                return
+
+
+class FileTransport:
+    """Guarda cada mensaje como .eml en un directorio (desarrollo / entornos sin SMTP)."""
+
+    def __init__(self, directory: str = EMAIL_FILE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def send_many(self, messages: list) -> list:
+        results = []
+        for msg in messages:
+            path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.eml")
+            try:
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(msg.as_string())
+                results.append(True)
+            except OSError as e:
+                print(f"Failed to write email to {path}: {e}")
+                results.append(False)
+        return results
+
+    def close(self):
+        pass
+
+
+class MemoryTransport:
+    """Guarda los mensajes en memoria (self.outbox), para pruebas."""
+
+    def __init__(self):
+        self.outbox = []
+        self._lock = threading.Lock()
+
+    def send_many(self, messages: list) -> list:
+        with self._lock:
+            self.outbox.extend(messages)
+        return [True] * len(messages)
+
+    def close(self):
+        pass
+
+
+def build_transport(backend: str = EMAIL_BACKEND):
+    if backend == "smtp":
+        return SMTPTransport()
+    if backend == "file":
+        return FileTransport()
+    if backend == "memory":
+        return MemoryTransport()
+    raise ValueError(f"Unknown EMAIL_BACKEND '{backend}' (smtp, file or memory)")
+
+
+mail_transport = build_transport()
+
+
+def send_emails(emails: list, transport=None) -> list:
+    """
+    emails: [(to_email, subject, body)]. Envía el lote por una sola sesión SMTP.
+    Returns [bool] por email.
+    """
+    transport = transport or mail_transport
+    messages = [build_message(to, subject, body, getattr(transport, "sender", None)) for to, subject, body in emails]
+    results = transport.send_many(messages)
+    if len(emails) == 1:
+        if results[0]:
+            print(f"Email sent successfully to {emails[0][0]}")
+    elif any(results):
+        print(f"Email sent successfully to {sum(results)}/{len(results)} recipients")
+    return results
+
 
 def send_email(to_email: str, subject: str, body: str):
     """
-    Sends an email using Gmail SMTP.
+    Sends an email using the configured transport (Gmail SMTP by default).
     """
-    if not EMAIL_USER or not EMAIL_PASSWORD:
-        print("Error: Email credentials not found in environment variables.")
-        return False
-
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = EMAIL_USER
-        msg['To'] = to_email
-        msg['Subject'] = subject
-
-        msg.attach(MIMEText(body, 'html'))
-
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(EMAIL_USER, EMAIL_PASSWORD)
-        text = msg.as_string()
-        server.sendmail(EMAIL_USER, to_email, text)
-        server.quit()
-        print(f"Email sent successfully to {to_email}")
-        return True
-    except Exception as e:
-        print(f"Failed to send email: {e}")
-        return False
+    return send_emails([(to_email, subject, body)])[0]
@@ -0,0 +1,21 @@
+import os
+import json
+import tempfile
+
+
+def atomic_write_json(data: dict, path: str, **json_kwargs):
+    """
+    Escribe JSON en un temporal del mismo directorio y lo renombra con os.replace:
+    los lectores nunca ven un fichero a medio escribir.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, **json_kwargs)
+        os.chmod(tmp_path, 0o644) # mkstemp crea el fichero con 0600
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,119 @@
+import unicodedata
+from collections import deque
+
+
+def _build_accent_table() -> dict:
+    # Latin-1 + Latin Extended-A: "á" -> "a", "ñ" -> "n", "ç" -> "c"... (str.translate, sin bucle Python)
+    table = {}
+    for code in range(0xC0, 0x180):
+        char = chr(code)
+        base = unicodedata.normalize("NFKD", char)[0]
+        if base != char and base.isascii():
+            table[code] = base
+    return table
+
+
+ACCENT_TABLE = _build_accent_table()
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas y sin tildes (las posiciones de los matches se refieren a este texto)."""
+    return (text or "").lower().translate(ACCENT_TABLE)
+
+
+class KeywordMatcher:
+    """
+    Autómata Aho–Corasick sobre varios léxicos ({categoría: [términos]}).
+    Encuentra todas las apariciones de todos los términos en una sola pasada por el texto,
+    sin importar cuántos términos haya. Texto y términos se normalizan (minúsculas, sin tildes).
+
+    Por defecto un término cuenta en cualquier posición, como `k in text` ("acoso" encuentra
+    "ciberacoso"). word_start: categorías (o True = todas) en las que un término solo cuenta si
+    empieza una palabra ("bien" ya no encuentra "también", pero sí "bienestar").
+    """
+
+    def __init__(self, lexicons: dict, word_start=()):
+        self.categories = list(lexicons)
+        self.word_start = set(self.categories) if word_start is True else set(word_start or ())
+        self.terms = [] # (término normalizado, categoría)
+        seen = set()
+        for category, terms in lexicons.items():
+            for term in terms:
+                normalized = normalize_text(term).strip()
+                if normalized and (normalized, category) not in seen:
+                    seen.add((normalized, category))
+                    self.terms.append((normalized, category))
+        self._build()
+
+    def _build(self):
+        # 1. Trie
+        goto = [{}]
+        outputs = [[]]
+        for term_id, (term, _) in enumerate(self.terms):
+            state = 0
+            for char in term:
+                nxt = goto[state].get(char)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][char] = nxt
+                    goto.append({})
+                    outputs.append([])
+                state = nxt
+            outputs[state].append(term_id)
+
+        # 2. Enlaces de fallo (BFS) y transiciones completas: el recorrido nunca retrocede
+        fail = [0] * len(goto)
+        delta = [dict(edges) for edges in goto]
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in goto[state].items():
+                queue.append(nxt)
+                if state:
+                    fallback = fail[state]
+                    while fallback and char not in goto[fallback]:
+                        fallback = fail[fallback]
+                    fail[nxt] = goto[fallback].get(char, 0)
+                outputs[nxt] = outputs[nxt] + outputs[fail[nxt]]
+            # Hereda las transiciones del estado de fallo (ya completas: BFS va por profundidad)
+            if state:
+                for char, nxt in delta[fail[state]].items():
+                    delta[state].setdefault(char, nxt)
+
+        self._delta = delta
+        self._outputs = [tuple(o) for o in outputs]
+        self._lengths = [len(term) for term, _ in self.terms]
+        self._word_start = [category in self.word_start for _, category in self.terms]
+
+    def __len__(self):
+        return len(self.terms)
+
+    def iter_matches(self, text: str, normalized: bool = False):
+        """Yields (start, end, término, categoría) de cada aparición, en orden de fin."""
+        if not normalized:
+            text = normalize_text(text)
+        delta, outputs, lengths, terms, word_start = self._delta, self._outputs, self._lengths, self.terms, self._word_start
+        state = 0
+        for end, char in enumerate(text, 1):
+            state = delta[state].get(char, 0)
+            if outputs[state]:
+                for term_id in outputs[state]:
+                    start = end - lengths[term_id]
+                    if word_start[term_id] and start > 0 and text[start - 1].isalnum():
+                        continue
+                    term, category = terms[term_id]
+                    yield start, end, term, category
+
+    def matched_terms(self, text: str) -> dict:
+        """{categoría: set de términos distintos encontrados}."""
+        found = {category: set() for category in self.categories}
+        for _, _, term, category in self.iter_matches(text):
+            found[category].add(term)
+        return found
+
+    def counts(self, text: str) -> dict:
+        """
+        {categoría: nº de términos distintos encontrados}. Misma semántica que `k in text`, salvo en
+        las categorías de word_start: ahí el término debe empezar una palabra ("bien" no cuenta en "también").
+        """
+        return {category: len(terms) for category, terms in self.matched_terms(text).items()}
@@ -1,14 +1,88 @@
 
+import os
+import json
+import hashlib
 from typing import List
 from ..models import ClassObservation
+from .keyword_matcher import KeywordMatcher
+from .cache import LRUCache
 
 POSITIVE_KEYWORDS = ["normal", "bien", "tranquilo", "positivo", "mejora", "adecuado", "colaborativo"]
 NEGATIVE_KEYWORDS = ["conflicto", "agresión", "pelea", "insulto", "rumor", "amenaza", "bullying", "acoso", "golpe", "llanto", "miedo", "aislado"]
 
+# Léxicos adicionales opcionales: JSON {"negative": [...], "positive": [...], "<otra categoría>": [...]}
+LEXICONS_PATH = os.getenv("TEXT_LEXICONS_PATH")
+
+def load_lexicons(path: str = None) -> dict:
+    """Léxicos base + los del fichero (si existe), por categoría."""
+    lexicons = {"negative": list(NEGATIVE_KEYWORDS), "positive": list(POSITIVE_KEYWORDS)}
+    if path:
+        with open(path, encoding="utf-8") as f:
+            for category, terms in json.load(f).items():
+                if not category.startswith("_"):
+                    lexicons.setdefault(category, []).extend(terms)
+    return lexicons
+
+# Autómata construido una vez al importar: una sola pasada por texto para todas las palabras.
+# Los léxicos de riesgo cuentan también dentro de compuestos ("ciberacoso"); solo los positivos
+# exigen inicio de palabra, porque términos cortos como "bien" aparecían dentro de "también"
+keyword_matcher = KeywordMatcher(load_lexicons(LEXICONS_PATH), word_start={"positive"})
+
+def score_observation(content: str):
+    """
+    Returns (neg_count, pos_count, row_risk) para una observación.
+    Se calcula una vez al guardar la observación y se persiste en class_observations.
+    """
+    # Nº de palabras clave distintas de cada léxico (sin tildes; las positivas, al inicio de palabra)
+    counts = keyword_matcher.counts(content)
+    neg_count = counts["negative"]
+    pos_count = counts["positive"]
+    
+    # Row score: -1 (Good) to +N (Bad)
+    # We want to normalize to 0..1 eventually for the whole set
+    
+    # Heuristic: 
+    # If neg > 0 -> Risk increases
+    # If pos > neg -> Risk decreases (or stays 0)
+    
+    row_risk = 0.0
+    if neg_count > 0:
+        row_risk = 0.2 + (neg_count * 0.1) # Base risk + severity
+    elif pos_count > 0:
+        row_risk = 0.0
+    else:
+        row_risk = 0.05 # Uncertainty / Neutral
+        
+    return neg_count, pos_count, row_risk
+
+# Caché de score_text_risk por hash del texto (no guarda textos completos en memoria)
+TEXT_RISK_CACHE_SIZE = 4096
+_text_risk_cache = LRUCache(TEXT_RISK_CACHE_SIZE)
+
+def score_text_risk(text: str) -> float:
+    """
+    Riesgo de un texto libre (p.ej. p_observations) de 0.0 a 1.0, local y sin red.
+    Cuenta términos distintos de todos los léxicos salvo "positive" (negative + categorías
+    extra del fichero de léxicos) con la misma escala que row_risk: 0.2 + 0.1 por término.
+    """
+    if not text or not text.strip():
+        return 0.0
+    key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+    cached = _text_risk_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    counts = keyword_matcher.counts(text)
+    risk_terms = sum(n for category, n in counts.items() if category != "positive")
+    risk = min(0.2 + risk_terms * 0.1, 1.0) if risk_terms else 0.0
+    _text_risk_cache.put(key, risk)
+    return risk
+
 def calculate_atmosphere_score(observations: List[ClassObservation]) -> float:
     """
     Calculates a 'Negative Atmosphere Score' from 0.0 (Good) to 1.0 (Bad).
     Based on recent teacher observations.
+    Usa row_risk precalculado si existe; solo analiza el texto en filas sin backfill.
     """
     if not observations:
         return 0.0
@@ -17,26 +91,9 @@ def calculate_atmosphere_score(observations: List[ClassObservation]) -> float:
     count = 0
     
     for obs in observations:
-        content = obs.content.lower()
-        
-        # Simple negative keyword count
-        neg_count = sum(1 for k in NEGATIVE_KEYWORDS if k in content)
-        pos_count = sum(1 for k in POSITIVE_KEYWORDS if k in content)
-        
-        # Row score: -1 (Good) to +N (Bad)
-        # We want to normalize to 0..1 eventually for the whole set
-        
-        # Heuristic: 
-        # If neg > 0 -> Risk increases
-        # If pos > neg -> Risk decreases (or stays 0)
-        
-        row_risk = 0.0
-        if neg_count > 0:
-            row_risk = 0.2 + (neg_count * 0.1) # Base risk + severity
-        elif pos_count > 0:
-            row_risk = 0.0
-        else:
-            row_risk = 0.05 # Uncertainty / Neutral
+        row_risk = getattr(obs, "row_risk", None)
+        if row_risk is None:
+            row_risk = score_observation(obs.content)[2]
             
         total_score += row_risk
         count += 1
@@ -1,5 +1,7 @@
 @echo off
 cd /d "%~dp0"
 echo Starting Anti-Bullying App...
+REM El dispatcher envia las alertas de la tabla alert_outbox (sin el no sale ningun email de alerta)
+start "Alert Dispatcher" python scripts\run_alert_dispatcher.py
 python -m uvicorn app.main:app --reload
 pause
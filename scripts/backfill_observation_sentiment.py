@@ -0,0 +1,62 @@
+import sys
+import os
+import time
+import argparse
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import engine
+from app.models import ClassObservation
+from app.utils.text_analysis import score_observation
+from app.atmosphere import rebuild_teacher_atmosphere
+
+def backfill(chunk_size=1000, recompute=False):
+    """
+    Rellena neg_count / pos_count / row_risk de las observaciones existentes.
+    Por defecto solo las que aún no lo tienen; con recompute=True recalcula todas
+    (por ejemplo tras cambiar las listas de palabras clave).
+    Al final reconstruye la tabla teacher_atmosphere.
+    Keyset sobre id y commit por bloque: se puede interrumpir y relanzar sin problema.
+    """
+    last_id = 0
+    updated = 0
+    start = time.perf_counter()
+    while True:
+        with Session(engine) as db:
+            query = db.query(ClassObservation.id, ClassObservation.content)\
+                .filter(ClassObservation.id > last_id)
+            if not recompute:
+                query = query.filter(ClassObservation.row_risk.is_(None))
+            rows = query.order_by(ClassObservation.id).limit(chunk_size).all()
+            if not rows:
+                break
+
+            batch = []
+            for r in rows:
+                neg_count, pos_count, row_risk = score_observation(r.content)
+                batch.append({"id": r.id, "neg_count": neg_count, "pos_count": pos_count, "row_risk": row_risk})
+            db.execute(update(ClassObservation), batch)
+            db.commit()
+
+        last_id = rows[-1].id
+        updated += len(rows)
+        print(f"  updated {updated} observations (last id {last_id})")
+
+    # La puntuación materializada por profesor depende de row_risk: reconstruirla
+    with Session(engine) as db:
+        teachers = rebuild_teacher_atmosphere(db)
+
+    print(f"Backfill finished: {updated} observations, {teachers} teachers in {time.perf_counter() - start:.1f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Precalcula el sentimiento de las observaciones de clase existentes.")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Filas por bloque/transacción")
+    parser.add_argument("--recompute", action="store_true", help="Recalcula también las filas que ya tienen valor")
+    args = parser.parse_args()
+    backfill(chunk_size=args.chunk_size, recompute=args.recompute)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import sys
+import os
+import time
+import argparse
+import threading
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.email import SMTPTransport, build_message
+
+class StandInSMTPHandler(socketserver.StreamRequestHandler):
+    """
+    Servidor SMTP mínimo en local (sin TLS ni login) que acepta todo y cuenta mensajes.
+    handshake_ms simula el coste de conectar + STARTTLS + login de un servidor real.
+    """
+
+    def reply(self, line: str):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        time.sleep(server.handshake_ms / 1000)
+        self.reply("220 stand-in ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip().upper()
+            if command.startswith("EHLO") or command.startswith("HELO"):
+                self.reply("250 stand-in")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                time.sleep(server.message_ms / 1000)
+                with server.lock:
+                    server.messages += 1
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else: # MAIL, RCPT, RSET, NOOP
+                self.reply("250 OK")
+
+class StandInSMTPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, handshake_ms: float, message_ms: float):
+        super().__init__(("127.0.0.1", 0), StandInSMTPHandler)
+        self.handshake_ms = handshake_ms
+        self.message_ms = message_ms
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+
+    def reset(self):
+        self.connections = 0
+        self.messages = 0
+
+def make_emails(n):
+    return [build_message(f"profesor{i}@colegio.com", f"Alerta {i}", f"<p>Plan de acción {i}</p>") for i in range(n)]
+
+def run_case(label, server, transport, emails, workers, batch):
+    server.reset()
+    start = time.perf_counter()
+    if batch:
+        results = transport.send_many(emails)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda msg: transport.send_many([msg])[0], emails))
+    elapsed = time.perf_counter() - start
+    transport.close()
+    print(f"{label:<36} {elapsed * 1000:8.0f} ms  {len(emails) / elapsed:7.0f} msg/s  "
+          f"{server.connections:4d} connections  {sum(results)}/{len(emails)} sent")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara el envío de emails con conexión por mensaje, pool persistente y lotes contra un SMTP local.")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=4, help="Hilos enviando a la vez (como el dispatcher de alertas)")
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--handshake-ms", type=float, default=30, help="Coste simulado de conectar + TLS + login")
+    parser.add_argument("--message-ms", type=float, default=1, help="Coste simulado por mensaje")
+    args = parser.parse_args()
+
+    server = StandInSMTPServer(args.handshake_ms, args.message_ms)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    emails = make_emails(args.messages)
+
+    def transport(persistent):
+        return SMTPTransport(host=host, port=port, starttls=False, auth=False,
+                             pool_size=args.pool_size if persistent else args.workers, persistent=persistent)
+
+    print(f"{args.messages} messages, handshake {args.handshake_ms:.0f} ms, {args.workers} workers, pool {args.pool_size}")
+    run_case("one connection per message", server, transport(False), emails, args.workers, batch=False)
+    run_case("pooled persistent connections", server, transport(True), emails, args.workers, batch=False)
+    run_case("batch over one session", server, transport(True), emails, args.workers, batch=True)
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import sys
+import os
+import time
+import argparse
+import numpy as np
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ml_engine import model_holder, feature_contributions, EXPLANATION_MODES
+
+def survey_like_rows(n, n_patterns, n_features, seed=42):
+    # Las encuestas reales repiten patrones: muestreamos n filas de un conjunto de n_patterns vectores
+    rng = np.random.default_rng(seed)
+    patterns = np.column_stack([
+        rng.integers(0, 5, (n_patterns, 13)),
+        np.round(rng.random((n_patterns, n_features - 13)), 2)
+    ]).astype(np.float64)
+    return patterns[rng.integers(0, n_patterns, n)]
+
+def top3(vals):
+    # Mismo criterio que predict_risk: top 3 por |impacto|, solo los que suben el riesgo
+    order = np.argsort(-np.abs(vals), kind="stable")[:3]
+    return tuple(i for i in order if vals[i] > 0)
+
+def main():
+    parser = argparse.ArgumentParser(description="Latencia y acuerdo top-3 de los modos de explicación.")
+    parser.add_argument("--rows", type=int, default=2000, help="Encuestas a explicar (una por llamada)")
+    parser.add_argument("--patterns", type=int, default=300, help="Vectores de respuesta distintos")
+    args = parser.parse_args()
+
+    clf, version = model_holder.current()
+    if clf is None:
+        print("No model available.")
+        sys.exit(1)
+
+    X = survey_like_rows(args.rows, args.patterns, clf.n_features_in_)
+    # Calentar explainer / bosque compilado (se construyen una vez por versión)
+    for mode in EXPLANATION_MODES:
+        feature_contributions(clf, version, X[:1], mode)
+
+    results = {}
+    for mode in EXPLANATION_MODES:
+        timings = []
+        vals = []
+        for row in X:
+            start = time.perf_counter()
+            vals.append(feature_contributions(clf, version, row[None, :], mode)[0])
+            timings.append(time.perf_counter() - start)
+        results[mode] = (np.array(vals), np.array(timings) * 1000)
+
+    exact = results["exact"][0]
+    print(f"Model {version}: {args.rows} single-row explanations, {args.patterns} distinct answer patterns")
+    print(f"{'MODE':<8}{'p50 ms':>10}{'p99 ms':>10}{'top-3 agree':>14}{'top-1 agree':>14}")
+    for mode, (vals, timings) in results.items():
+        same_top3 = np.mean([top3(a) == top3(b) for a, b in zip(vals, exact)])
+        same_top1 = np.mean([top3(a)[:1] == top3(b)[:1] for a, b in zip(vals, exact)])
+        print(f"{mode:<8}{np.percentile(timings, 50):>10.3f}{np.percentile(timings, 99):>10.3f}"
+              f"{same_top3:>14.1%}{same_top1:>14.1%}")
+
+    stats = model_holder.stats()["derived"].get("shap_memo")
+    if stats:
+        print(f"cached mode memo: {stats['size']} entries, hit rate {stats['hit_rate']:.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import sys
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ml_engine import model_holder, FEATURE_COLUMNS
+from app.forest_engine import CompiledForest
+
+def random_features(n, n_features, seed=42):
+    # Items 0..4 y features continuas (sentimiento de clase, text_risk) 0..1, como en producción
+    rng = np.random.default_rng(seed)
+    return np.column_stack([rng.integers(0, 5, (n, 13)), rng.random((n, n_features - 13))]).astype(np.float64)
+
+def timed(fn, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return np.percentile(timings, 50) * 1000, np.percentile(timings, 99) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Paridad y latencia: sklearn vs CompiledForest.")
+    parser.add_argument("--rows", type=int, default=5000, help="Filas aleatorias para la comprobación de paridad")
+    parser.add_argument("--runs", type=int, default=200, help="Repeticiones para medir latencia de 1 fila")
+    args = parser.parse_args()
+
+    clf, version = model_holder.current()
+    if clf is None:
+        print("No model available.")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    compiled = CompiledForest.from_sklearn(clf)
+    print(f"Model {version}: compiled {len(compiled.feature)} nodes in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    # 1. Paridad
+    # Modelos antiguos conocen solo las primeras n_features_in_ columnas
+    columns = FEATURE_COLUMNS[:clf.n_features_in_]
+    X = random_features(args.rows, len(columns))
+    expected = clf.predict_proba(pd.DataFrame(X, columns=columns))[:, 1]
+    got = compiled.predict_proba(X)
+    max_diff = float(np.abs(expected - got).max())
+    print(f"Parity on {args.rows} rows: max |diff| = {max_diff:.2e}")
+
+    # 2. Latencia de una fila
+    row = X[:1]
+    row_df = pd.DataFrame(row, columns=columns)
+    p50, p99 = timed(lambda: clf.predict_proba(row_df), args.runs)
+    print(f"sklearn   1 row: p50 {p50:.3f} ms  p99 {p99:.3f} ms")
+    p50, p99 = timed(lambda: compiled.predict_proba(row), args.runs)
+    print(f"compiled  1 row: p50 {p50:.3f} ms  p99 {p99:.3f} ms")
+
+    if max_diff > 1e-9:
+        print("❌ Parity check FAILED")
+        sys.exit(1)
+    print("✅ Parity check passed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import sys
+import os
+import time
+import argparse
+import numpy as np
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.schemas import SurveyInput
+from app.agents.predictor import heuristic_engine
+from app.utils.text_analysis import score_text_risk, keyword_matcher, _text_risk_cache
+
+# Frases de ejemplo para componer observaciones de familias
+SENTENCES = [
+    "Últimamente llega a casa muy callado y no quiere hablar del colegio.",
+    "Dice que algunos compañeros le insultan en el recreo y le tiene miedo a uno de ellos.",
+    "Ha vuelto con la mochila rota y un golpe en el brazo que no sabe explicar.",
+    "Duerme mal y por las mañanas se queja de dolor de tripa.",
+    "Está más tranquilo desde que cambió de grupo, lo vemos bien.",
+    "Recibe mensajes en el móvil a horas raras y lo esconde cuando entramos.",
+    "Comenta que hay rumores sobre él en un grupo de WhatsApp de la clase.",
+    "No ha habido ningún problema, todo normal.",
+]
+
+def make_texts(n, sentences_per_text, seed=42):
+    rng = np.random.default_rng(seed)
+    return [
+        " ".join(SENTENCES[i] for i in rng.integers(0, len(SENTENCES), sentences_per_text)) + f" ({k})"
+        for k in range(n)
+    ]
+
+def timed(fn, items):
+    timings = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        timings.append(time.perf_counter() - start)
+    return np.percentile(timings, 50) * 1000, np.percentile(timings, 99) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Latencia del riesgo de texto libre (p_observations) en el envío.")
+    parser.add_argument("--texts", type=int, default=2000, help="Observaciones distintas")
+    args = parser.parse_args()
+
+    print(f"Lexicon: {len(keyword_matcher)} terms in {len(keyword_matcher.categories)} categories")
+
+    for label, sentences in (("short (~3 sentences)", 3), ("long (~40 sentences)", 40)):
+        texts = make_texts(args.texts, sentences)
+        _text_risk_cache.clear()
+        cold = timed(score_text_risk, texts)
+        warm = timed(score_text_risk, texts)
+        print(f"score_text_risk {label}, {np.mean([len(t) for t in texts]):.0f} chars: "
+              f"cold p50 {cold[0]:.3f} ms p99 {cold[1]:.3f} ms | cached p50 {warm[0]:.4f} ms")
+
+    # Coste añadido a analyze() (lo que ejecuta submit_survey) con y sin texto
+    rng = np.random.default_rng(0)
+    texts = make_texts(args.texts, 3, seed=1)
+    _text_risk_cache.clear()
+    surveys = [
+        {**{f"p_item_{i}": int(v) for i, v in enumerate(rng.integers(0, 5, 13), 1)}, "p_observations": text}
+        for text in texts
+    ]
+    without_text = [SurveyInput(**{k: v for k, v in s.items() if k != "p_observations"}) for s in surveys]
+    with_text = [SurveyInput(**s) for s in surveys]
+    base = timed(lambda s: heuristic_engine.analyze(s, 0.2), without_text)
+    full = timed(lambda s: heuristic_engine.analyze(s, 0.2), with_text)
+    print(f"analyze() without text: p50 {base[0]:.3f} ms | with new text: p50 {full[0]:.3f} ms p99 {full[1]:.3f} ms "
+          f"(+{full[0] - base[0]:.3f} ms)")
+
+    if full[0] - base[0] > 2.0:
+        print("❌ Free-text scoring adds more than 2 ms per submission")
+        sys.exit(1)
+    print("✅ Free-text scoring within budget")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import sys
+import os
+import time
+import argparse
+import numpy as np
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.schemas import SurveyInput, RiskAnalysisResult
+from app.models import AlertLevel
+from app.agents.predictor import heuristic_engine, HeuristicPredictor, PARENT_FIELDS, TEACHER_FIELDS
+
+def reference_analyze(data: SurveyInput, teacher_sentiment: float = 0.0) -> RiskAnalysisResult:
+    """
+    Reglas originales escritas a mano (antes de risk_rules.json), como oráculo independiente
+    del plan compilado. Si se cambian las reglas a propósito, esta referencia dejará de coincidir.
+    """
+    flags = []
+    if data.t_vic_insults is not None:
+        vic_score = sum([data.t_vic_insults or 0, data.t_vic_exclusion or 0, data.t_vic_physical or 0,
+                         data.t_vic_theft or 0, data.t_vic_rumors or 0, data.t_vic_threats or 0])
+        agg_score = sum([data.t_agg_insults or 0, data.t_agg_exclusion or 0, data.t_agg_physical or 0,
+                         data.t_agg_theft or 0, data.t_agg_rumors or 0])
+        cyber_score = sum([data.t_cyber_messages or 0, data.t_cyber_anxiety or 0])
+        score = vic_score + agg_score + cyber_score
+        if vic_score > 10: flags.append("Alta Victimización detectada")
+        if agg_score > 10: flags.append("Comportamiento Agresor detectado")
+        if cyber_score > 4: flags.append("Indicios de Ciberacoso")
+    else:
+        score_a = sum([data.p_item_1 or 0, data.p_item_2 or 0, data.p_item_3 or 0, data.p_item_4 or 0, data.p_item_5 or 0])
+        score_b = sum([data.p_item_6 or 0, data.p_item_7 or 0, data.p_item_8 or 0, data.p_item_9 or 0, data.p_item_10 or 0])
+        score_c = sum([data.p_item_11 or 0, data.p_item_12 or 0, data.p_item_13 or 0])
+        score = score_a + score_b + score_c
+        if score_a > 8: flags.append("Indicadores Directos/Físicos Altos")
+        if score_b > 10: flags.append("Alto Malestar Psicosomático")
+        if score_c > 5: flags.append("Indicios de Ciberacoso")
+        if (data.p_item_2 or 0) >= 3 or (data.p_item_5 or 0) >= 3:
+            flags.append("Marcador Crítico Detectado (Heridas/Coacción)")
+        if teacher_sentiment > 0.3:
+            sentiment_boost = int(teacher_sentiment * 10)
+            score += sentiment_boost
+            flags.append(f"Ambiente de Clase Negativo (+{sentiment_boost})")
+
+    if score > 25: risk_level = AlertLevel.CRITICAL
+    elif score > 15: risk_level = AlertLevel.HIGH
+    elif score > 8: risk_level = AlertLevel.MEDIUM
+    else: risk_level = AlertLevel.LOW
+
+    return RiskAnalysisResult(total_score=score, risk_level=risk_level.value, flags=flags,
+                              recommendation=HeuristicPredictor._get_recommendation(risk_level))
+
+def check(rows, teacher, rng):
+    fields = TEACHER_FIELDS if teacher else PARENT_FIELDS
+    items = rng.integers(0, 5, (rows, len(fields)))
+    # Algunas respuestas vacías (None en el formulario)
+    missing = rng.random((rows, len(fields))) < 0.05
+    sentiments = np.round(rng.random(rows), 2)
+
+    surveys = []
+    for r in range(rows):
+        values = {f: (None if missing[r, i] else int(items[r, i])) for i, f in enumerate(fields)}
+        if teacher:
+            values["t_vic_insults"] = int(items[r, 0]) # analyze() detecta el modo profesor por este campo
+        surveys.append(SurveyInput(**values))
+
+    matrix = np.where(missing, np.nan, items)
+    if teacher:
+        matrix[:, 0] = items[:, 0]
+
+    expected = [reference_analyze(s, float(t)) for s, t in zip(surveys, sentiments)]
+
+    start = time.perf_counter()
+    single = [heuristic_engine.analyze(s, float(t)) for s, t in zip(surveys, sentiments)]
+    single_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    bulk = heuristic_engine.analyze_bulk(matrix, sentiments, teacher=teacher)
+    bulk_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    many = heuristic_engine.analyze_many([s.model_dump() for s in surveys], sentiments)
+    many_time = time.perf_counter() - start
+
+    mismatches = sum(1 for r in range(rows) if bulk.result(r) != expected[r] or single[r] != expected[r] or many[r] != expected[r])
+    kind = "teacher" if teacher else "parent"
+    print(f"{kind:<8} {rows} rows: analyze {single_time * 1000:.1f} ms, analyze_bulk {bulk_time * 1000:.2f} ms, "
+          f"analyze_many {many_time * 1000:.1f} ms, mismatches {mismatches}")
+    return mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description="Paridad de analyze(), analyze_bulk() y analyze_many() con las reglas de referencia.")
+    parser.add_argument("--rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    mismatches = check(args.rows, False, rng) + check(args.rows, True, rng)
+    if mismatches:
+        print("❌ Parity check FAILED")
+        sys.exit(1)
+    print("✅ Parity check passed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import time
+import asyncio
+import argparse
+import random
+import numpy as np
+import httpx
+
+def random_survey(rng, max_value):
+    # Encuesta de padres con items 0..max_value (max_value bajo = sin alertas ni llamadas al LLM)
+    return {f"p_item_{i}": rng.randint(0, max_value) for i in range(1, 14)}
+
+async def get_token(client, email, password):
+    response = await client.post("/auth/login", data={"username": email, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+async def run(args):
+    rng = random.Random(42)
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60, limits=limits) as client:
+        token = args.token or await get_token(client, args.email, args.password)
+        headers = {"Authorization": f"Bearer {token}"}
+        student_ids = [int(s) for s in args.student_ids.split(",")]
+
+        latencies = []
+        errors = 0
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(
+                    "/surveys/api/submit",
+                    params={"student_id": rng.choice(student_ids)},
+                    json=random_survey(rng, args.max_value),
+                    headers=headers
+                )
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+
+        # Calentamiento (conexiones, imports perezosos)
+        await asyncio.gather(*(one() for _ in range(min(args.concurrency, args.requests))))
+        latencies.clear()
+        errors = 0
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(args.requests)))
+        elapsed = time.perf_counter() - start
+
+    ms = np.array(latencies) * 1000
+    print(f"{args.requests} requests, concurrency {args.concurrency}: {args.requests / elapsed:.0f} req/s, {errors} errors")
+    print(f"latency p50 {np.percentile(ms, 50):.1f} ms | p95 {np.percentile(ms, 95):.1f} ms | "
+          f"p99 {np.percentile(ms, 99):.1f} ms | max {ms.max():.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de POST /surveys/api/submit contra un servidor en marcha.")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--token", help="JWT de un usuario (si no, se hace login con --email/--password)")
+    parser.add_argument("--email")
+    parser.add_argument("--password")
+    parser.add_argument("--student-ids", required=True, help="IDs de alumno separados por comas")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--max-value", type=int, default=1, help="Valor máximo de los items (1 = riesgo bajo, sin alertas)")
+    args = parser.parse_args()
+    if not args.token and not (args.email and args.password):
+        parser.error("--token or --email/--password is required")
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import sys
+import os
+import argparse
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.model_registry import model_registry
+
+def list_models():
+    versions = model_registry.list_versions()
+    if not versions:
+        print("Registry is empty (predictions fall back to model.pkl).")
+        return
+
+    print(f"{'':2}{'VERSION':<28}{'ROWS':>8}{'TRAIN(s)':>10}{'OOB ACC':>9}{'1-ROW ms':>10}")
+    for m in versions:
+        metrics = m.get("metrics", {})
+        bench = m.get("inference_benchmark", {})
+        print(f"{'*' if m.get('active') else '':2}{m['version']:<28}{m.get('training_rows', '-'):>8}"
+              f"{m.get('training_time_s', '-'):>10}{metrics.get('oob_accuracy', '-'):>9}"
+              f"{bench.get('single_row_ms_p50', '-'):>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Gestión del registro de modelos.")
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("list", help="Lista las versiones registradas (* = activa)")
+    activate = sub.add_parser("activate", help="Activa una versión (rollback / promoción)")
+    activate.add_argument("version")
+    args = parser.parse_args()
+
+    if args.command == "activate":
+        model_registry.activate(args.version)
+        print(f"Active model: {args.version}")
+    else:
+        list_models()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import sys
+import os
+import argparse
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.rescoring import rescore_surveys, RESCORE_CHUNK_SIZE, SENTIMENT_SOURCES
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-puntúa las encuestas históricas con los umbrales heurísticos actuales.")
+    parser.add_argument("--chunk-size", type=int, default=RESCORE_CHUNK_SIZE, help="Filas por bloque/transacción")
+    parser.add_argument("--restart", action="store_true", help="Ignora el checkpoint y empieza desde el principio")
+    parser.add_argument("--sentiment", choices=SENTIMENT_SOURCES, default="stored",
+                        help="Sentimiento del profesor: el guardado con cada encuesta (por defecto), el actual o ninguno")
+    parser.add_argument("--dry-run", action="store_true", help="Calcula los cambios sin escribirlos")
+    parser.add_argument("--pause", type=float, default=0.0, help="Segundos de pausa entre bloques")
+    args = parser.parse_args()
+
+    def report(state):
+        print(f"  scanned {state['scanned']} | changed {state['changed']} | last id {state['last_id']}")
+
+    rescore_surveys(
+        chunk_size=args.chunk_size,
+        resume=not args.restart,
+        sentiment_source=args.sentiment,
+        dry_run=args.dry_run,
+        pause=args.pause,
+        progress=report
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import sys
+import os
+import argparse
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.training_jobs import training_runner
+
+def main():
+    parser = argparse.ArgumentParser(description="Reentrena el modelo de riesgo en un proceso separado.")
+    parser.add_argument("--detach", action="store_true", help="Lanza el job y sale sin esperar")
+    parser.add_argument("--status", action="store_true", help="Muestra el estado del último job")
+    args = parser.parse_args()
+
+    if args.status:
+        print(training_runner.status())
+        return
+
+    if args.detach:
+        started, status = training_runner.start()
+        print(("Job started: " if started else "A training job is already running: ") + str(status))
+        return
+
+    status = training_runner.run_foreground()
+    print(f"Training job {status.get('job_id')} -> {status.get('state')} in {status.get('duration_s')}s")
+
+if __name__ == "__main__":
+    main()
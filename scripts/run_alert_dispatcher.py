@@ -0,0 +1,43 @@
+import sys
+import os
+import json
+import argparse
+
+# Add parent dir to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal, init_db
+from app.alert_outbox import AlertDispatcher, outbox_stats, retry_failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Envía las alertas del outbox (plan de acción + email) fuera del proceso web.")
+    parser.add_argument("--batch-size", type=int, default=20, help="Alertas reclamadas por lote")
+    parser.add_argument("--concurrency", type=int, default=4, help="Alertas procesándose a la vez (LLM + SMTP)")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="Segundos de espera cuando no hay alertas")
+    parser.add_argument("--once", action="store_true", help="Procesa lo pendiente y sale (cron)")
+    parser.add_argument("--status", action="store_true", help="Muestra cuántas alertas hay en cada estado")
+    parser.add_argument("--retry-failed", action="store_true", help="Devuelve a la cola las alertas que agotaron los reintentos")
+    args = parser.parse_args()
+
+    init_db()
+    if args.status or args.retry_failed:
+        db = SessionLocal()
+        try:
+            if args.retry_failed:
+                print(f"Requeued {retry_failed(db)} failed alerts")
+            print(json.dumps(outbox_stats(db)))
+        finally:
+            db.close()
+        return
+
+    dispatcher = AlertDispatcher(batch_size=args.batch_size, concurrency=args.concurrency, poll_interval=args.poll_interval)
+    try:
+        if args.once:
+            print(f"Alerts: {dispatcher.drain()}")
+        else:
+            dispatcher.run_forever()
+    except KeyboardInterrupt:
+        print("Dispatcher stopped")
+
+if __name__ == "__main__":
+    main()
@@ -18,7 +18,13 @@ def update_schema():
             "ALTER TABLE schools ADD COLUMN latitude FLOAT",
             "ALTER TABLE schools ADD COLUMN longitude FLOAT",
             "ALTER TABLE schools ADD COLUMN phone VARCHAR",
-            "ALTER TABLE survey_responses ADD COLUMN expert_label VARCHAR"
+            "ALTER TABLE survey_responses ADD COLUMN expert_label VARCHAR",
+            "ALTER TABLE survey_responses ADD COLUMN teacher_sentiment FLOAT",
+            "ALTER TABLE survey_responses ADD COLUMN text_risk FLOAT",
+            "ALTER TABLE class_observations ADD COLUMN neg_count INTEGER",
+            "ALTER TABLE class_observations ADD COLUMN pos_count INTEGER",
+            "ALTER TABLE class_observations ADD COLUMN row_risk FLOAT",
+            "CREATE INDEX IF NOT EXISTS ix_submission_keys_created_at ON submission_keys (created_at)"
         ]
         
         for stmt in statements: